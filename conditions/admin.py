@@ -1,5 +1,138 @@
+import csv
+import json
+from itertools import chain
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Location, WeatherCondition, WaterCondition, RowabilityScore, Forecast
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Location, WeatherCondition, WaterCondition, RowabilityScore, Forecast, ScoringProfile, Watchlist, Watch
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def estimated_row_count(model, using='default'):
+    """
+    Return the database's own row estimate for a model's table, or None if it has none
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+        # Only populated once ANALYZE has run; the first number is the table's row count
+        'sqlite': ("SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class AtLeastCount(int):
+    """A row count that stopped at its cap, shown as e.g. '10000+'"""
+
+    def __str__(self):
+        return f"{int(self)}+"
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an unbounded COUNT(*).
+
+    Unfiltered lists of large tables use the database's row estimate.
+    Anything else is counted up to ADMIN_EXACT_COUNT_LIMIT rows past the
+    requested page, so every row stays reachable by paging on and a capped
+    count is shown as a lower bound.
+    """
+    requested_page = 1  # set by ConditionTableAdmin.get_paginator
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        cap = max(self.requested_page, 1) * self.per_page + limit
+        count = queryset[:cap + 1].count()
+        return AtLeastCount(cap) if count > cap else count
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+class ConditionTableAdmin(admin.ModelAdmin):
+    """
+    Admin for large per-location condition tables.
+
+    Lists join their location in the same query, never count the whole
+    table exactly and can be exported as CSV or NDJSON with a streaming
+    response that reads rows in chunks.
+    """
+    list_select_related = ['location']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ['location__name']
+    readonly_fields = ['created_at']
+    actions = ['export_csv', 'export_ndjson']
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator = super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        try:
+            paginator.requested_page = int(request.GET.get(PAGE_VAR, 1))
+        except ValueError:
+            pass
+        return paginator
+
+    def export_fields(self):
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+        return fields[:2] + ['location__name'] + fields[2:]
+
+    def export_rows(self, queryset):
+        # iterator() streams from a server-side cursor where the database supports one
+        return queryset.order_by().values_list(*self.export_fields()).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    def export_response(self, content, extension, content_type):
+        filename = f"{self.model._meta.model_name}-{timezone.now():%Y%m%d-%H%M%S}.{extension}"
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @admin.action(description='Export selected rows as CSV', permissions=['view'])
+    def export_csv(self, request, queryset):
+        writer = csv.writer(Echo())
+        rows = chain([self.export_fields()], self.export_rows(queryset))
+        content = (writer.writerow(row) for row in rows)
+        return self.export_response(content, 'csv', 'text/csv')
+
+    @admin.action(description='Export selected rows as NDJSON', permissions=['view'])
+    def export_ndjson(self, request, queryset):
+        fields = self.export_fields()
+        content = (
+            json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+            for row in self.export_rows(queryset)
+        )
+        return self.export_response(content, 'ndjson', 'application/x-ndjson')
 
 
 @admin.register(Location)
@@ -10,33 +143,62 @@ class LocationAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+class TideTypeFilter(admin.SimpleListFilter):
+    """Fixed tide types, so the sidebar needs no DISTINCT scan of the table"""
+    title = 'tide type'
+    parameter_name = 'tide_type'
+
+    def lookups(self, request, model_admin):
+        return [(value, value.capitalize()) for value in ['high', 'low', 'rising', 'falling']]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(tide_type=self.value())
+        return queryset
+
+
 @admin.register(WeatherCondition)
-class WeatherConditionAdmin(admin.ModelAdmin):
+class WeatherConditionAdmin(ConditionTableAdmin):
     list_display = ['location', 'timestamp', 'temperature', 'wind_speed', 'wind_gust', 'weather_description']
-    list_filter = ['timestamp', 'weather_description']
-    search_fields = ['location__name']
-    readonly_fields = ['created_at']
+    date_hierarchy = 'timestamp'
 
 
 @admin.register(WaterCondition)
-class WaterConditionAdmin(admin.ModelAdmin):
+class WaterConditionAdmin(ConditionTableAdmin):
     list_display = ['location', 'timestamp', 'water_level', 'flow_rate', 'tide_height', 'tide_type']
-    list_filter = ['timestamp', 'tide_type']
-    search_fields = ['location__name']
-    readonly_fields = ['created_at']
+    list_filter = [TideTypeFilter]
+    date_hierarchy = 'timestamp'
 
 
 @admin.register(RowabilityScore)
-class RowabilityScoreAdmin(admin.ModelAdmin):
+class RowabilityScoreAdmin(ConditionTableAdmin):
     list_display = ['location', 'timestamp', 'score', 'score_value']
-    list_filter = ['score', 'timestamp']
-    search_fields = ['location__name']
-    readonly_fields = ['created_at']
+    list_filter = ['score']  # choices field, so the sidebar needs no query
+    date_hierarchy = 'timestamp'
 
 
 @admin.register(Forecast)
-class ForecastAdmin(admin.ModelAdmin):
+class ForecastAdmin(ConditionTableAdmin):
     list_display = ['location', 'forecast_date', 'forecast_time', 'temperature_min', 'temperature_max', 'wind_speed']
-    list_filter = ['forecast_date', 'forecast_time']
-    search_fields = ['location__name']
-    readonly_fields = ['created_at']
+    date_hierarchy = 'forecast_date'
+
+
+@admin.register(ScoringProfile)
+class ScoringProfileAdmin(admin.ModelAdmin):
+    list_display = ['slug', 'name', 'updated_at']
+    search_fields = ['slug', 'name']
+    readonly_fields = ['created_at', 'updated_at']
+
+
+class WatchInline(admin.TabularInline):
+    model = Watch
+    extra = 0
+    raw_id_fields = ['location']
+    readonly_fields = ['last_category', 'last_outlook_category', 'last_evaluated_at']
+
+
+@admin.register(Watchlist)
+class WatchlistAdmin(admin.ModelAdmin):
+    list_display = ['name', 'email', 'webhook_url', 'created_at']
+    search_fields = ['name', 'email']
+    inlines = [WatchInline]
@@ -0,0 +1,369 @@
+"""
+Compact columnar archives of historical conditions.
+
+Each (table, location) pair is written to its own directory holding one raw
+little-endian binary file per column plus a manifest.json describing the
+columns. Numeric columns are plain fixed-width arrays (dtype strings in the
+manifest are NumPy-compatible, so numpy.memmap can open them directly) and
+text columns are dictionary encoded as int32 codes. Archives are written in
+streamed chunks and read back through mmap, so analytics never hold a whole
+table in memory or touch the database.
+"""
+import json
+import math
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import WeatherCondition, WaterCondition, RowabilityScore, Forecast
+
+
+ARCHIVE_VERSION = 1
+DEFAULT_CHUNK_SIZE = 5000
+
+TIME = 'time'          # int64 seconds since the Unix epoch (UTC)
+FLOAT = 'float'        # float32, NaN for missing values
+INT = 'int'            # int32
+CATEGORY = 'category'  # int32 codes into the manifest's category list
+
+COLUMN_TYPES = {
+    TIME: ('q', '<i8'),
+    FLOAT: ('f', '<f4'),
+    INT: ('i', '<i4'),
+    CATEGORY: ('i', '<i4'),
+}
+
+# table name -> (model, time fields, [(column, kind), ...])
+# Forecast rows store date and time separately and are archived as one forecast_at column.
+ARCHIVE_TABLES = {
+    'weather': (WeatherCondition, ('timestamp',), [
+        ('timestamp', TIME),
+        ('temperature', FLOAT),
+        ('wind_speed', FLOAT),
+        ('wind_gust', FLOAT),
+        ('wind_direction', INT),
+        ('precipitation', FLOAT),
+        ('humidity', INT),
+        ('pressure', FLOAT),
+        ('visibility', FLOAT),
+        ('weather_description', CATEGORY),
+        ('icon_code', CATEGORY),
+    ]),
+    'water': (WaterCondition, ('timestamp',), [
+        ('timestamp', TIME),
+        ('water_level', FLOAT),
+        ('flow_rate', FLOAT),
+        ('tide_height', FLOAT),
+        ('tide_type', CATEGORY),
+        ('water_temperature', FLOAT),
+    ]),
+    'forecast': (Forecast, ('forecast_date', 'forecast_time'), [
+        ('forecast_at', TIME),
+        ('temperature_min', FLOAT),
+        ('temperature_max', FLOAT),
+        ('wind_speed', FLOAT),
+        ('wind_gust', FLOAT),
+        ('wind_direction', INT),
+        ('precipitation_probability', INT),
+        ('weather_description', CATEGORY),
+        ('icon_code', CATEGORY),
+    ]),
+    'scores': (RowabilityScore, ('timestamp',), [
+        ('timestamp', TIME),
+        ('score', CATEGORY),
+        ('score_value', INT),
+    ]),
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def get_archive_root(root=None):
+    return Path(root or getattr(settings, 'CONDITIONS_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+
+
+def archive_path(table, location_id, root=None):
+    return get_archive_root(root) / table / f"location_{location_id}"
+
+
+def _to_epoch(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return int(value.timestamp())
+
+
+def _write_chunk(handle, typecode, values):
+    chunk = array(typecode, values)
+    if sys.byteorder != 'little':
+        chunk.byteswap()
+    chunk.tofile(handle)
+
+
+def _moment(record, time_fields):
+    if len(time_fields) == 2:
+        return datetime.combine(record[0], record[1], tzinfo=dt_timezone.utc)
+    return record[0]
+
+
+def export_table(table, location_id, root=None, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Stream one location's rows of table into a columnar archive.
+
+    Archived rows from before the first exported row are carried over, so
+    history already pruned from the database (or outside since) survives a
+    re-export; from that row on the database replaces the archive. Rows are
+    read with a server-side iterator and flushed every chunk_size rows. The
+    archive is built in a temporary directory and swapped in at the end, so
+    readers never see a half-written archive. Returns the number of rows
+    exported from the database.
+    """
+    model, time_fields, columns = ARCHIVE_TABLES[table]
+    time_column = next(name for name, kind in columns if kind == TIME)
+    target = archive_path(table, location_id, root)
+    staging = target.with_name(target.name + '.tmp')
+    retired = target.with_name(target.name + '.old')
+    if retired.exists():
+        # Left by an export that stopped mid-swap; restore it if it was never replaced
+        if target.exists():
+            shutil.rmtree(retired)
+        else:
+            os.replace(retired, target)
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+
+    queryset = model.objects.filter(location_id=location_id).order_by(*time_fields)
+    if since is not None:
+        queryset = queryset.filter(**{f'{time_fields[0]}__gte': since})
+    field_names = list(time_fields) + [name for name, kind in columns if kind != TIME]
+
+    previous = ArchiveTable(target) if (target / 'manifest.json').exists() else None
+    kept = 0
+    if previous is not None:
+        first = queryset.values_list(*time_fields).first()
+        kept = len(previous)
+        if first is not None:
+            kept = bisect_left(previous.column(time_column), _to_epoch(_moment(first, time_fields)))
+
+    categories = {name: {} for name, kind in columns if kind == CATEGORY}
+    handles = {name: open(staging / f"{name}.bin", 'wb') for name, kind in columns}
+    buffers = {name: [] for name, kind in columns}
+    rows = 0
+
+    def flush():
+        for name, kind in columns:
+            _write_chunk(handles[name], COLUMN_TYPES[kind][0], buffers[name])
+            buffers[name].clear()
+
+    def append(values):
+        for name, kind in columns:
+            value = values[name]
+            if kind == TIME:
+                buffers[name].append(_to_epoch(value))
+            elif kind == FLOAT:
+                buffers[name].append(math.nan if value is None else float(value))
+            elif kind == INT:
+                buffers[name].append(int(value))
+            else:
+                codes = categories[name]
+                buffers[name].append(codes.setdefault(value or '', len(codes)))
+
+    try:
+        # Archived rows are re-encoded since category codes are renumbered
+        for start in range(0, kept, chunk_size):
+            stop = min(start + chunk_size, kept)
+            decoded = {name: previous.decode(name, start, stop) for name, kind in columns}
+            for index in range(stop - start):
+                append({name: decoded[name][index] for name, kind in columns})
+            flush()
+
+        for record in queryset.values_list(*field_names).iterator(chunk_size=chunk_size):
+            values = dict(zip(field_names[len(time_fields):], record[len(time_fields):]))
+            values[time_column] = _moment(record, time_fields)
+            append(values)
+
+            rows += 1
+            if rows % chunk_size == 0:
+                flush()
+        flush()
+    finally:
+        for handle in handles.values():
+            handle.close()
+        if previous is not None:
+            previous.close()
+
+    manifest = {
+        'version': ARCHIVE_VERSION,
+        'table': table,
+        'location_id': location_id,
+        'rows': kept + rows,
+        'exported_at': datetime.now(dt_timezone.utc).isoformat(),
+        'columns': [
+            {'name': name, 'kind': kind, 'dtype': COLUMN_TYPES[kind][1]}
+            for name, kind in columns
+        ],
+        'categories': {name: list(codes) for name, codes in categories.items()},
+    }
+    with open(staging / 'manifest.json', 'w') as handle:
+        json.dump(manifest, handle, indent=2)
+
+    # Two renames leave the target missing only between them, where deleting it first would
+    # leave it missing for the whole rmtree; readers with files open keep the old data
+    if target.exists():
+        os.replace(target, retired)
+    os.replace(staging, target)
+    if retired.exists():
+        shutil.rmtree(retired)
+    return rows
+
+
+class ArchiveTable:
+    """
+    Read-only, memory-mapped view of one exported (table, location) archive
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path / 'manifest.json') as handle:
+                self.manifest = json.load(handle)
+        except FileNotFoundError:
+            raise ArchiveError(f"No archive at {self.path}")
+        if self.manifest.get('version') != ARCHIVE_VERSION:
+            raise ArchiveError(f"Unsupported archive version in {self.path}")
+        self.columns = {column['name']: column for column in self.manifest['columns']}
+        self._maps = {}
+        self._views = {}
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def location_id(self):
+        return self.manifest['location_id']
+
+    def column(self, name):
+        """
+        Return a zero-copy memoryview of a column's raw values
+        """
+        if name in self._views:
+            return self._views[name]
+        if name not in self.columns:
+            raise ArchiveError(f"Unknown column {name!r}")
+
+        typecode = COLUMN_TYPES[self.columns[name]['kind']][0]
+        if not len(self):
+            view = memoryview(array(typecode))
+        elif sys.byteorder != 'little':
+            # Big-endian hosts cannot use the file bytes as-is
+            values = array(typecode)
+            with open(self.path / f"{name}.bin", 'rb') as handle:
+                values.fromfile(handle, len(self))
+            values.byteswap()
+            view = memoryview(values)
+        else:
+            with open(self.path / f"{name}.bin", 'rb') as handle:
+                mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = mapped
+            view = memoryview(mapped).cast(typecode)
+        self._views[name] = view
+        return view
+
+    def categories(self, name):
+        return self.manifest['categories'][name]
+
+    def decode(self, name, start=0, stop=None):
+        """
+        Return a column slice as Python values, with categories decoded and NaN as None
+        """
+        kind = self.columns[name]['kind']
+        values = self.column(name)[start:stop]
+        if kind == CATEGORY:
+            labels = self.categories(name)
+            return [labels[code] for code in values]
+        if kind == FLOAT:
+            return [None if math.isnan(value) else value for value in values]
+        if kind == TIME:
+            return [datetime.fromtimestamp(value, dt_timezone.utc) for value in values]
+        return list(values)
+
+    def close(self):
+        for view in self._views.values():
+            view.release()
+        for mapped in self._maps.values():
+            mapped.close()
+        self._views.clear()
+        self._maps.clear()
+
+
+def open_archive(table, location_id, root=None):
+    return ArchiveTable(archive_path(table, location_id, root))
+
+
+def iter_archives(table, root=None):
+    """
+    Yield an ArchiveTable for every exported location of table
+    """
+    table_dir = get_archive_root(root) / table
+    if not table_dir.is_dir():
+        return
+    for path in sorted(table_dir.glob('location_*')):
+        if path.suffix not in ('.tmp', '.old') and (path / 'manifest.json').exists():
+            yield ArchiveTable(path)
+
+
+def import_table(archive, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Bulk-insert an archive's rows back into its model, skipping rows that already exist.
+
+    Only the archived columns are restored: RowabilityScore factors and
+    recommendations come back empty. bulk_create bypasses post_save, so
+    rollups and latest conditions are not updated; rebuild them afterwards
+    (import_archive does). Returns the number of rows submitted.
+    """
+    model, time_fields, columns = ARCHIVE_TABLES[archive.manifest['table']]
+    decimal_places = {
+        field.name: field.decimal_places
+        for field in model._meta.get_fields()
+        if getattr(field, 'decimal_places', None) is not None
+    }
+    def build(decoded, index):
+        fields = {'location_id': archive.location_id}
+        for name, kind in columns:
+            value = decoded[name][index]
+            if kind == TIME:
+                if len(time_fields) == 2:
+                    fields[time_fields[0]] = value.date()
+                    fields[time_fields[1]] = value.time()
+                else:
+                    fields[name] = value
+            elif name in decimal_places and value is not None:
+                fields[name] = round(Decimal(repr(value)), decimal_places[name])
+            else:
+                fields[name] = value
+        if model is RowabilityScore:
+            fields['factors'] = []
+        return model(**fields)
+
+    for start in range(0, len(archive), chunk_size):
+        stop = min(start + chunk_size, len(archive))
+        decoded = {name: archive.decode(name, start, stop) for name, kind in columns}
+        batch = [build(decoded, index) for index in range(stop - start)]
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+    return len(archive)
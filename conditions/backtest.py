@@ -0,0 +1,164 @@
+"""
+Replay archived weather observations through alternative rule sets.
+
+Works on the columnar archives written by export_archive, so a backtest
+never touches the database. Each location's archive is scored in chunks
+by a worker process and reduced to a small summary.
+
+Observations are flagged as daylight or not from the location's
+coordinates, as live scoring does, so the darkness penalty counts the
+same way in both. Locations without known coordinates are scored as
+daylight.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from .scoring import CATEGORIES, DEFAULT_SCORING
+from .solar import daylight_flags, get_timezone
+
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# An observation stands for the time until the next one, capped so gaps in
+# the record do not count as hours of rowing
+MAX_OBSERVATION_HOURS = 3.0
+
+BACKTEST_COLUMNS = ['timestamp', 'wind_speed', 'wind_gust', 'temperature', 'precipitation', 'visibility']
+
+
+def _observation_hours(timestamps, next_timestamp):
+    """
+    Hours each observation covers, given the timestamp that follows the chunk
+    """
+    following = list(timestamps[1:])
+    following.append(next_timestamp)
+    return [
+        min(MAX_OBSERVATION_HOURS, (after - before) / 3600) if after is not None else 1.0
+        for before, after in zip(timestamps, following)
+    ]
+
+
+def _daylight(site, timestamps):
+    """
+    Daylight flags for epoch timestamps at site, a (latitude, longitude, timezone name) tuple
+    """
+    latitude, longitude, timezone_name = site
+    moments = [datetime.fromtimestamp(timestamp, dt_timezone.utc) for timestamp in timestamps]
+    return [flags['daylight'] for flags in daylight_flags(latitude, longitude, moments, get_timezone(timezone_name))]
+
+
+def _empty_summary(location_id):
+    return {
+        'location_id': location_id,
+        'observations': 0,
+        'baseline': {category: 0 for category in CATEGORIES},
+        'candidate': {category: 0 for category in CATEGORIES},
+        'baseline_rowable_hours': 0.0,
+        'candidate_rowable_hours': 0.0,
+        'changed': 0,
+    }
+
+
+def backtest_archive(path, candidate, baseline=DEFAULT_SCORING, rowable_threshold=6,
+                     chunk_size=DEFAULT_CHUNK_SIZE, sites=None):
+    """
+    Score one weather archive with both rule sets and summarise the differences.
+
+    sites maps location id -> (latitude, longitude, timezone name) and
+    supplies the daylight flags.
+    """
+    # Imported here so worker processes only need Django once they run a task
+    from .archive import ArchiveTable
+
+    with ArchiveTable(path) as archive:
+        summary = _empty_summary(archive.location_id)
+        site = (sites or {}).get(archive.location_id)
+        total = len(archive)
+        timestamps = archive.column('timestamp')
+
+        for start in range(0, total, chunk_size):
+            stop = min(start + chunk_size, total)
+            columns = [archive.column(name)[start:stop] for name in BACKTEST_COLUMNS]
+            chunk_times = columns[0]
+            hours = _observation_hours(chunk_times, timestamps[stop] if stop < total else None)
+
+            daylight = _daylight(site, chunk_times) if site else None
+
+            before = baseline.score_batch(*columns[1:], daylight=daylight)
+            after = candidate.score_batch(*columns[1:], daylight=daylight)
+            for old, new, span in zip(before, after, hours):
+                summary['baseline'][baseline.category(old)] += 1
+                summary['candidate'][candidate.category(new)] += 1
+                if old >= rowable_threshold:
+                    summary['baseline_rowable_hours'] += span
+                if new >= rowable_threshold:
+                    summary['candidate_rowable_hours'] += span
+                if old != new:
+                    summary['changed'] += 1
+
+            for column in columns:
+                column.release()
+            summary['observations'] += stop - start
+
+    summary['baseline_rowable_hours'] = round(summary['baseline_rowable_hours'], 1)
+    summary['candidate_rowable_hours'] = round(summary['candidate_rowable_hours'], 1)
+    summary['rowable_hours_delta'] = round(
+        summary['candidate_rowable_hours'] - summary['baseline_rowable_hours'], 1
+    )
+    return summary
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+def run_backtest(paths, candidate, baseline=DEFAULT_SCORING, rowable_threshold=6,
+                 workers=None, chunk_size=DEFAULT_CHUNK_SIZE, sites=None):
+    """
+    Backtest every archive path, fanning out over worker processes.
+
+    Yields one summary per location in path order. workers=1 runs in
+    process, which is easier to debug and avoids pool start-up for small runs.
+    """
+    paths = [str(path) for path in paths]
+    options = {
+        'candidate': candidate,
+        'baseline': baseline,
+        'rowable_threshold': rowable_threshold,
+        'chunk_size': chunk_size,
+        'sites': sites,
+    }
+    if workers == 1 or len(paths) <= 1:
+        for path in paths:
+            yield backtest_archive(path, **options)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as pool:
+        futures = [pool.submit(backtest_archive, path, **options) for path in paths]
+        for future in futures:
+            yield future.result()
+
+
+def combine_summaries(summaries):
+    """
+    Sum per-location summaries into a single overall summary
+    """
+    total = _empty_summary(None)
+    total['rowable_hours_delta'] = 0.0
+    for summary in summaries:
+        total['observations'] += summary['observations']
+        total['changed'] += summary['changed']
+        for side in ('baseline', 'candidate'):
+            for category, count in summary[side].items():
+                total[side][category] += count
+        for key in ('baseline_rowable_hours', 'candidate_rowable_hours', 'rowable_hours_delta'):
+            total[key] = round(total[key] + summary[key], 1)
+    return total
+
+
+def category_shares(counts):
+    observations = sum(counts.values())
+    if not observations:
+        return {category: 0.0 for category in counts}
+    return {category: round(100 * count / observations, 1) for category, count in counts.items()}
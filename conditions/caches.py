@@ -0,0 +1,97 @@
+"""
+In-process TTL caches for upstream lookups.
+
+Each cache registers under a name so warmstart.py can snapshot it to disk
+and restore it in a freshly started worker. Keys are tuples of plain values
+and values must be JSON serializable.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+_registry = {}
+
+
+class TTLCache:
+    """
+    Thread-safe mapping whose entries expire a fixed time after being stored.
+
+    The lifetime is read from ttl_setting on each access so tests and
+    settings overrides take effect without restarting.
+    """
+
+    def __init__(self, name, ttl_setting, default_ttl, maxsize=10000):
+        self.name = name
+        self.ttl_setting = ttl_setting
+        self.default_ttl = default_ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (stored_at epoch seconds, value), oldest first
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    @property
+    def ttl(self):
+        return getattr(settings, self.ttl_setting, self.default_ttl)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] >= self.ttl:
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return entry[1]
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._entries[key] = (stored_at or time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def dump(self):
+        """
+        Return [[key, stored_at, value], ...] for entries that have not expired
+        """
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [[list(key), stored_at, value] for key, (stored_at, value) in self._entries.items() if stored_at > cutoff]
+
+    def restore(self, entries):
+        """
+        Add dumped entries that are still fresh and newer than what is cached; returns the count added
+        """
+        cutoff = time.time() - self.ttl
+        restored = 0
+        for key, stored_at, value in sorted(entries, key=lambda entry: entry[1]):
+            key = tuple(key)
+            current = self._entries.get(key)
+            if stored_at > cutoff and (current is None or current[0] < stored_at):
+                self.set(key, value, stored_at=stored_at)
+                restored += 1
+        return restored
+
+
+def registered_caches():
+    return dict(_registry)
+
+
+def point_key(lat, lng, places):
+    """Cache key for a coordinate, rounded so nearby requests share an entry"""
+    return (round(float(lat), places), round(float(lng), places))
+
+
+# Current conditions per ~100m point, and reverse-geocoded addresses per ~10m point
+weather_cache = TTLCache('weather', 'WEATHER_CACHE_SECONDS', 600)
+geocode_cache = TTLCache('geocode', 'GEOCODE_CACHE_SECONDS', 30 * 86400)
@@ -0,0 +1,165 @@
+"""
+Request deadlines and admission control for the conditions endpoint.
+
+A Deadline is created per request and handed to every upstream call (as a
+capped socket timeout, and checked between body chunks) and database query
+(checked before execution), so one slow dependency cannot hold a worker past
+the request budget. The admission_control decorator sheds requests once too
+many are in flight, or while every upstream thread is still busy with calls
+that earlier requests gave up on.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """Time budget for one request"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded(f"request budget of {self.seconds}s exhausted")
+
+    def timeout(self, cap):
+        """
+        Timeout for an upstream call: cap, shortened to what is left of the budget
+        """
+        self.check()
+        return min(cap, self.remaining())
+
+    def _check_query(self, execute, sql, params, many, context):
+        self.check()
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def guard_queries(self):
+        """
+        Refuse to start database queries on this thread once the deadline has passed
+        """
+        with connection.execute_wrapper(self._check_query):
+            yield
+
+
+def get_request_budget():
+    return getattr(settings, 'CONDITIONS_REQUEST_BUDGET_SECONDS', 1.5)
+
+
+class UpstreamPool:
+    """
+    Thread pool for upstream calls that tracks how many calls it holds.
+
+    A call its request stopped waiting for keeps its thread until the
+    call's own deadline checks end it, so the count includes abandoned work.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upstream')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(fn, *args, **kwargs)
+        # Runs on completion and on cancellation alike
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def saturated(self):
+        """True while every thread is taken, so new calls would queue"""
+        return self._pending >= self.max_workers
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Shared pool for upstream calls made on behalf of requests.
+
+    Sized from CONDITIONS_MAX_IN_FLIGHT so admitted requests never queue
+    behind each other for a thread.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                capacity = getattr(settings, 'CONDITIONS_MAX_IN_FLIGHT', 32)
+                _executor = UpstreamPool(max_workers=capacity * 2)
+    return _executor
+
+
+class AdmissionController:
+    """Counts in-flight requests and turns new ones away past capacity"""
+
+    def __init__(self):
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _get_slots(self):
+        if self._slots is None:
+            with self._lock:
+                if self._slots is None:
+                    self._slots = threading.BoundedSemaphore(getattr(settings, 'CONDITIONS_MAX_IN_FLIGHT', 32))
+        return self._slots
+
+    def acquire(self):
+        # Queue briefly so short bursts are absorbed rather than rejected
+        wait = getattr(settings, 'CONDITIONS_ADMISSION_WAIT_SECONDS', 0.1)
+        return self._get_slots().acquire(timeout=wait)
+
+    def release(self):
+        self._get_slots().release()
+
+
+admission = AdmissionController()
+
+
+def admission_control(view):
+    """
+    Reject requests with 503 while CONDITIONS_MAX_IN_FLIGHT requests are already
+    running, or while abandoned upstream calls hold every upstream thread
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if get_executor().saturated() or not admission.acquire():
+            return Response(
+                {'error': 'Service busy, please retry shortly'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '1'},
+            )
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            admission.release()
+    return wrapper
@@ -0,0 +1,370 @@
+"""
+Gridded weather layer.
+
+refresh_weather_grid fetches current weather and the 5-day/3-hour forecast
+for every node of a coarse lattice over each configured region and stores
+them as flat float32 arrays. Point queries are answered by bilinear
+interpolation between the four surrounding nodes, so any coordinate inside
+a fresh grid is served without an upstream call.
+"""
+import json
+import math
+import os
+import shutil
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import requests
+from django.conf import settings
+
+from .snapshots import upstream_get
+
+
+GRID_VERSION = 1
+
+# Scalar variables stored per node; wind direction is stored as u/v components
+# so it can be interpolated without wrapping problems at north
+CURRENT_FIELDS = [
+    'temperature', 'wind_speed', 'wind_gust', 'wind_u', 'wind_v', 'precipitation',
+    'humidity', 'pressure', 'visibility',
+]
+FORECAST_FIELDS = [
+    'temperature_min', 'temperature_max', 'wind_speed', 'wind_gust', 'wind_u', 'wind_v',
+    'precipitation_probability',
+]
+# Text fields are not interpolated, they come from the nearest node
+TEXT_FIELDS = ['weather_description', 'icon_code']
+FORECAST_SLOT = timedelta(hours=3)
+
+
+def get_grid_root():
+    return Path(getattr(settings, 'WEATHER_GRID_DIR', settings.BASE_DIR / 'weather_grid'))
+
+
+def get_regions():
+    return getattr(settings, 'WEATHER_GRID_REGIONS', {})
+
+
+def _wind_components(speed, degrees):
+    # Meteorological convention: degrees is where the wind blows from
+    radians = math.radians(degrees)
+    return -speed * math.sin(radians), -speed * math.cos(radians)
+
+
+def _wind_direction(u, v):
+    return round(math.degrees(math.atan2(-u, -v))) % 360
+
+
+class Lattice:
+    """Regular lat/lng lattice over a bounding box, indexed row-major from the south-west corner"""
+
+    def __init__(self, south, west, north, east, step):
+        self.south, self.west, self.north, self.east, self.step = south, west, north, east, step
+        self.rows = int(round((north - south) / step)) + 1
+        self.cols = int(round((east - west) / step)) + 1
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def point(self, index):
+        row, col = divmod(index, self.cols)
+        return round(self.south + row * self.step, 6), round(self.west + col * self.step, 6)
+
+    def contains(self, lat, lng):
+        return self.south <= lat <= self.north and self.west <= lng <= self.east
+
+    def corners(self, lat, lng):
+        """
+        Return [(node index, bilinear weight), ...] for the cell containing (lat, lng)
+        """
+        y = (lat - self.south) / self.step
+        x = (lng - self.west) / self.step
+        row = min(int(y), self.rows - 2) if self.rows > 1 else 0
+        col = min(int(x), self.cols - 2) if self.cols > 1 else 0
+        dy, dx = y - row, x - col
+        corners = []
+        for d_row, weight_y in ((0, 1 - dy), (1, dy)):
+            for d_col, weight_x in ((0, 1 - dx), (1, dx)):
+                r, c = row + d_row, col + d_col
+                if r < self.rows and c < self.cols:
+                    corners.append((r * self.cols + c, weight_y * weight_x))
+        return corners
+
+
+def _interpolate(values, corners, offset=0, stride=1):
+    """
+    Weighted mean of values at the corner nodes, skipping missing (NaN) nodes
+    """
+    total = weight_sum = 0.0
+    for index, weight in corners:
+        value = values[index * stride + offset]
+        if weight > 0 and not math.isnan(value):
+            total += value * weight
+            weight_sum += weight
+    if not weight_sum:
+        return None
+    return total / weight_sum
+
+
+class WeatherGrid:
+    """In-memory view of one region's stored grid"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / 'grid.json') as handle:
+            self.manifest = json.load(handle)
+        if self.manifest.get('version') != GRID_VERSION:
+            raise ValueError(f"unsupported grid version in {self.path}")
+        bounds = self.manifest['bounds']
+        self.lattice = Lattice(*bounds, self.manifest['step'])
+        self.fetched_at = datetime.fromisoformat(self.manifest['fetched_at'])
+        self.slots = self.manifest['forecast_slots']
+        self.current = {name: self._read(f"current_{name}") for name in CURRENT_FIELDS}
+        self.forecast = {name: self._read(f"forecast_{name}") for name in FORECAST_FIELDS}
+        self.text = self.manifest['text']
+
+    def _read(self, name):
+        values = array('f')
+        with open(self.path / f"{name}.bin", 'rb') as handle:
+            values.frombytes(handle.read())
+        return values
+
+    def is_fresh(self, now=None):
+        max_age = getattr(settings, 'WEATHER_GRID_MAX_AGE_MINUTES', 90)
+        now = now or datetime.now(dt_timezone.utc)
+        return now - self.fetched_at <= timedelta(minutes=max_age)
+
+    def _nearest(self, corners, values, offset=0, stride=1):
+        """Heaviest corner node that has data"""
+        usable = [corner for corner in corners if not math.isnan(values[corner[0] * stride + offset])]
+        return max(usable, key=lambda corner: corner[1])[0]
+
+    def current_conditions(self, lat, lng):
+        corners = self.lattice.corners(lat, lng)
+        values = {name: _interpolate(self.current[name], corners) for name in CURRENT_FIELDS}
+        if values['wind_speed'] is None or values['temperature'] is None:
+            return None
+
+        nearest = self._nearest(corners, self.current['wind_speed'])
+        return {
+            'temperature': round(values['temperature'], 1),
+            'wind_speed': round(values['wind_speed'], 1),
+            'wind_gust': round(values['wind_gust'] or 0, 1),
+            'wind_direction': _wind_direction(values['wind_u'] or 0, values['wind_v'] or 0),
+            'precipitation': round(values['precipitation'] or 0, 1),
+            'humidity': round(values['humidity'] or 0),
+            'pressure': round(values['pressure'] or 0),
+            'visibility': round(values['visibility'] or 10, 1),
+            'weather_description': self.text['current']['weather_description'][nearest],
+            'icon_code': self.text['current']['icon_code'][nearest],
+        }
+
+    def forecast_slots(self, lat, lng, start=None, until=None, tz=None):
+        """
+        Interpolated 3-hour forecast slots overlapping [start, until), dated in tz
+        """
+        corners = self.lattice.corners(lat, lng)
+        stride = len(self.slots)
+        slots = []
+        for offset, timestamp in enumerate(self.slots):
+            moment = datetime.fromtimestamp(timestamp, dt_timezone.utc)
+            if start is not None and moment + FORECAST_SLOT <= start:
+                continue
+            if until is not None and moment >= until:
+                break
+            values = {
+                name: _interpolate(self.forecast[name], corners, offset, stride)
+                for name in FORECAST_FIELDS
+            }
+            if values['wind_speed'] is None:
+                continue
+            nearest = self._nearest(corners, self.forecast['wind_speed'], offset, stride)
+            moment = moment.astimezone(tz or dt_timezone.utc)
+            slots.append({
+                'date': moment.date().isoformat(),
+                'time': moment.strftime('%H:%M'),
+                'temperature_min': round(values['temperature_min'], 1),
+                'temperature_max': round(values['temperature_max'], 1),
+                'wind_speed': round(values['wind_speed'], 1),
+                'wind_gust': round(values['wind_gust'] or 0, 1),
+                'wind_direction': _wind_direction(values['wind_u'] or 0, values['wind_v'] or 0),
+                'precipitation_probability': round(values['precipitation_probability'] or 0),
+                'weather_description': self.text['forecast']['weather_description'][nearest * stride + offset],
+                'icon_code': self.text['forecast']['icon_code'][nearest * stride + offset],
+            })
+        return slots
+
+
+_grids = {}
+_grids_lock = threading.Lock()
+
+
+def load_grid(region):
+    """
+    Return the stored grid for region, reloading it when the files on disk change
+    """
+    path = get_grid_root() / region
+    try:
+        modified = os.stat(path / 'grid.json').st_mtime
+    except OSError:
+        return None
+    cached = _grids.get(region)
+    if cached and cached[0] == modified:
+        return cached[1]
+    with _grids_lock:
+        try:
+            grid = WeatherGrid(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading weather grid {region}: {e}")
+            return None
+        _grids[region] = (modified, grid)
+    return grid
+
+
+def find_grid(lat, lng):
+    """
+    Return a fresh grid covering (lat, lng), or None
+    """
+    lat, lng = float(lat), float(lng)
+    for region in get_regions():
+        grid = load_grid(region)
+        if grid and grid.lattice.contains(lat, lng) and grid.is_fresh():
+            return grid
+    return None
+
+
+def interpolate_current(lat, lng):
+    grid = find_grid(lat, lng)
+    return grid.current_conditions(float(lat), float(lng)) if grid else None
+
+
+def interpolate_forecast(lat, lng, days_ahead, tz=None):
+    grid = find_grid(lat, lng)
+    if not grid:
+        return None
+    now = datetime.now(dt_timezone.utc)
+    until = now + timedelta(days=days_ahead)
+    return grid.forecast_slots(float(lat), float(lng), start=now, until=until, tz=tz)
+
+
+def _fetch_node(session, lat, lng):
+    params = {
+        'lat': lat,
+        'lon': lng,
+        'appid': settings.OPENWEATHERMAP_API_KEY,
+        'units': 'metric',
+        'lang': 'en'
+    }
+    base_url = settings.OPENWEATHERMAP_BASE_URL
+    try:
+        current = upstream_get(f"{base_url}/weather", params=params, timeout=10, session=session)
+        forecast = upstream_get(f"{base_url}/forecast", params=params, timeout=10, session=session)
+        if current.status_code != 200 or forecast.status_code != 200:
+            print(f"OpenWeatherMap API error for grid node {lat}, {lng}: {current.status_code}/{forecast.status_code}")
+            return None, None
+        return current.json(), forecast.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error fetching grid node {lat}, {lng}: {e}")
+        return None, None
+
+
+def refresh_grid(region, config, workers=4):
+    """
+    Fetch every node of a region's lattice and store the grid.
+
+    Nodes that fail to fetch are stored as NaN and skipped by interpolation.
+    Returns (nodes fetched, total nodes).
+    """
+    lattice = Lattice(*config['bounds'], config['step'])
+    points = [lattice.point(index) for index in range(len(lattice))]
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda point: _fetch_node(session, *point), points))
+
+    now = datetime.now(dt_timezone.utc)
+    slot_times = sorted({
+        entry['dt']
+        for current, forecast in results if forecast
+        for entry in forecast.get('list', [])
+        if entry['dt'] >= (now - FORECAST_SLOT).timestamp()
+    })
+    slot_index = {timestamp: offset for offset, timestamp in enumerate(slot_times)}
+    stride = len(slot_times)
+
+    current = {name: array('f', [math.nan]) * len(points) for name in CURRENT_FIELDS}
+    forecast = {name: array('f', [math.nan]) * (len(points) * stride) for name in FORECAST_FIELDS}
+    text = {
+        'current': {name: [''] * len(points) for name in TEXT_FIELDS},
+        'forecast': {name: [''] * (len(points) * stride) for name in TEXT_FIELDS},
+    }
+
+    fetched = 0
+    for index, (weather, outlook) in enumerate(results):
+        if not weather:
+            continue
+        fetched += 1
+        wind = weather['wind']
+        u, v = _wind_components(wind['speed'], wind.get('deg', 0))
+        values = {
+            'temperature': weather['main']['temp'],
+            'wind_speed': wind['speed'],
+            'wind_gust': wind.get('gust', 0),
+            'wind_u': u,
+            'wind_v': v,
+            'precipitation': weather.get('rain', {}).get('1h', 0),
+            'humidity': weather['main']['humidity'],
+            'pressure': weather['main']['pressure'],
+            'visibility': weather.get('visibility', 10000) / 1000,
+        }
+        for name, value in values.items():
+            current[name][index] = value
+        text['current']['weather_description'][index] = weather['weather'][0]['description']
+        text['current']['icon_code'][index] = weather['weather'][0]['icon']
+
+        for entry in outlook.get('list', []):
+            if entry['dt'] not in slot_index:
+                continue
+            position = index * stride + slot_index[entry['dt']]
+            wind = entry['wind']
+            u, v = _wind_components(wind['speed'], wind.get('deg', 0))
+            values = {
+                'temperature_min': entry['main']['temp_min'],
+                'temperature_max': entry['main']['temp_max'],
+                'wind_speed': wind['speed'],
+                'wind_gust': wind.get('gust', 0),
+                'wind_u': u,
+                'wind_v': v,
+                'precipitation_probability': entry.get('pop', 0) * 100,
+            }
+            for name, value in values.items():
+                forecast[name][position] = value
+            text['forecast']['weather_description'][position] = entry['weather'][0]['description']
+            text['forecast']['icon_code'][position] = entry['weather'][0]['icon']
+
+    target = get_grid_root() / region
+    staging = target.with_name(region + '.tmp')
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+    for prefix, columns in (('current', current), ('forecast', forecast)):
+        for name, values in columns.items():
+            with open(staging / f"{prefix}_{name}.bin", 'wb') as handle:
+                values.tofile(handle)
+    with open(staging / 'grid.json', 'w') as handle:
+        json.dump({
+            'version': GRID_VERSION,
+            'region': region,
+            'bounds': list(config['bounds']),
+            'step': config['step'],
+            'fetched_at': now.isoformat(),
+            'nodes_fetched': fetched,
+            'forecast_slots': slot_times,
+            'text': text,
+        }, handle)
+
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    return fetched, len(points)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from conditions.rollups import apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Delete raw condition rows and rollups older than CONDITIONS_RETENTION_DAYS'
+
+    def handle(self, *args, **options):
+        deleted = apply_retention()
+        for table, count in deleted.items():
+            self.stdout.write(f"{table}: {count} deleted")
+        self.stdout.write(self.style.SUCCESS('Retention applied'))
@@ -0,0 +1,78 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from conditions.archive import iter_archives
+from conditions.backtest import DEFAULT_CHUNK_SIZE, category_shares, combine_summaries, run_backtest
+from conditions.models import Location
+from conditions.scoring import CATEGORIES, DEFAULT_SCORING, CompiledRules
+
+
+class Command(BaseCommand):
+    help = 'Replay archived weather observations through a candidate rule set and compare verdicts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('rules', help='JSON file of rule overrides (see conditions/scoring.py)')
+        parser.add_argument('--baseline', help='JSON rule file to compare against (default: current rules)')
+        parser.add_argument('--location', type=int, action='append', dest='locations',
+                            help='Only backtest this location id (repeatable)')
+        parser.add_argument('--input', help='Archive directory (default: CONDITIONS_ARCHIVE_DIR)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Worker processes (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            candidate = CompiledRules.from_json(options['rules'])
+            baseline = CompiledRules.from_json(options['baseline']) if options['baseline'] else DEFAULT_SCORING
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not load rules: {e}")
+
+        locations = set(options['locations'] or [])
+        paths, location_ids = [], []
+        for archive in iter_archives('weather', root=options['input']):
+            with archive:
+                if not locations or archive.location_id in locations:
+                    paths.append(archive.path)
+                    location_ids.append(archive.location_id)
+        if not paths:
+            raise CommandError('No weather archives found, run export_archive first')
+
+        # Coordinates for daylight flags; archives of deleted locations are scored as daylight
+        sites = {
+            location_id: (float(latitude), float(longitude), timezone_name)
+            for location_id, latitude, longitude, timezone_name in Location.objects.filter(
+                id__in=location_ids
+            ).values_list('id', 'latitude', 'longitude', 'timezone')
+        }
+
+        summaries = sorted(
+            run_backtest(
+                paths, candidate, baseline,
+                rowable_threshold=getattr(settings, 'ROWABLE_SCORE_THRESHOLD', 6),
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+                sites=sites,
+            ),
+            key=lambda summary: summary['location_id'],
+        )
+        total = combine_summaries(summaries)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'locations': summaries, 'total': total}, indent=2))
+            return
+
+        header = f"{'location':>10} {'obs':>9} {'changed':>8} {'rowable h':>10} {'delta h':>9}  categories (baseline -> candidate %)"
+        self.stdout.write(header)
+        for summary in summaries + [total]:
+            label = summary['location_id'] if summary['location_id'] is not None else 'total'
+            before = category_shares(summary['baseline'])
+            after = category_shares(summary['candidate'])
+            shares = ' '.join(f"{category[:4]} {before[category]}->{after[category]}" for category in CATEGORIES)
+            self.stdout.write(
+                f"{label:>10} {summary['observations']:>9} {summary['changed']:>8} "
+                f"{summary['candidate_rowable_hours']:>10} {summary['rowable_hours_delta']:>+9}  {shares}"
+            )
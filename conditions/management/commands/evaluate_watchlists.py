@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from conditions.watchlists import evaluate_watchlists
+
+
+class Command(BaseCommand):
+    help = 'Re-score watched locations with new data and send threshold notifications'
+
+    def handle(self, *args, **options):
+        notifications = evaluate_watchlists()
+        for notification in notifications:
+            self.stdout.write(notification['message'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {len(notifications)} notifications"))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from conditions.archive import ARCHIVE_TABLES, DEFAULT_CHUNK_SIZE, export_table
+from conditions.models import Location
+
+
+class Command(BaseCommand):
+    help = 'Export condition history per location into columnar archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', choices=sorted(ARCHIVE_TABLES), action='append', dest='tables',
+                            help='Table to export (repeatable, default: all)')
+        parser.add_argument('--location', type=int, action='append', dest='locations',
+                            help='Only export this location id (repeatable)')
+        parser.add_argument('--days', type=int,
+                            help='Only export rows from the last N days')
+        parser.add_argument('--output', help='Archive directory (default: CONDITIONS_ARCHIVE_DIR)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        tables = options['tables'] or sorted(ARCHIVE_TABLES)
+        since = None
+        if options['days']:
+            since = timezone.now() - timedelta(days=options['days'])
+
+        location_ids = options['locations']
+        if not location_ids:
+            location_ids = Location.objects.order_by('id').values_list('id', flat=True).iterator()
+
+        total = 0
+        for location_id in location_ids:
+            for table in tables:
+                total += export_table(table, location_id, root=options['output'],
+                                      since=since, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Exported {total} rows"))
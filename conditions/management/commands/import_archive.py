@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from conditions.archive import ARCHIVE_TABLES, DEFAULT_CHUNK_SIZE, TIME, import_table, iter_archives
+from conditions.rollups import rebuild_rollups
+from conditions.viewport import rebuild_latest_conditions
+
+# Tables that feed the rollups and the latest-conditions map table
+DERIVED_FROM = ('weather', 'scores')
+
+
+class Command(BaseCommand):
+    help = 'Restore condition history from columnar archives into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', choices=sorted(ARCHIVE_TABLES), action='append', dest='tables',
+                            help='Table to import (repeatable, default: all)')
+        parser.add_argument('--location', type=int, action='append', dest='locations',
+                            help='Only import this location id (repeatable)')
+        parser.add_argument('--input', help='Archive directory (default: CONDITIONS_ARCHIVE_DIR)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='Skip rebuilding rollups and latest conditions for imported locations')
+
+    def handle(self, *args, **options):
+        tables = options['tables'] or sorted(ARCHIVE_TABLES)
+        locations = set(options['locations'] or [])
+
+        total = 0
+        rebuild_ids, since = set(), None
+        for table in tables:
+            for archive in iter_archives(table, root=options['input']):
+                with archive:
+                    if locations and archive.location_id not in locations:
+                        continue
+                    total += import_table(archive, chunk_size=options['chunk_size'])
+                    if table in DERIVED_FROM and len(archive):
+                        time_column = next(name for name, column in archive.columns.items() if column['kind'] == TIME)
+                        first = archive.decode(time_column, 0, 1)[0]
+                        since = first if since is None else min(since, first)
+                        rebuild_ids.add(archive.location_id)
+        self.stdout.write(self.style.SUCCESS(f"Imported {total} rows (existing rows skipped)"))
+
+        # bulk_create skips the post_save signals that keep these tables current
+        if not rebuild_ids:
+            return
+        if options['no_rebuild']:
+            self.stdout.write('Run rebuild_rollups and rebuild_latest_conditions to refresh derived tables')
+            return
+        rebuild_rollups(since, location_ids=sorted(rebuild_ids))
+        count = rebuild_latest_conditions(location_ids=sorted(rebuild_ids))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups since {since.isoformat()} and latest conditions for {count} locations"
+        ))
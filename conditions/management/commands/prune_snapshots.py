@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from conditions.snapshots import get_store
+
+
+class Command(BaseCommand):
+    help = 'Delete upstream response snapshots older than UPSTREAM_SNAPSHOT_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float,
+                            default=getattr(settings, 'UPSTREAM_SNAPSHOT_RETENTION_DAYS', 30),
+                            help='Keep snapshots recorded within this many days')
+        parser.add_argument('--vacuum', action='store_true', help='Reclaim disk space afterwards')
+
+    def handle(self, *args, **options):
+        store = get_store()
+        deleted = store.prune(time.time() - options['days'] * 86400)
+        if options['vacuum']:
+            store.vacuum()
+        stats = store.stats()
+        self.stdout.write(f"{deleted} deleted, {stats['count']} kept ({stats['bytes'] // 1024} KiB)")
+        self.stdout.write(self.style.SUCCESS('Snapshots pruned'))
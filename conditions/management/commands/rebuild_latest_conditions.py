@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from conditions.viewport import rebuild_latest_conditions
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized latest-conditions map table from stored observations and scores'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--location', type=int, action='append', dest='locations',
+                            help='Only rebuild this location id (repeatable)')
+
+    def handle(self, *args, **options):
+        count = rebuild_latest_conditions(location_ids=options['locations'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt latest conditions for {count} locations"))
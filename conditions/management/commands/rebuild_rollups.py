@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from conditions.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute hourly and daily condition rollups from stored observations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Rebuild buckets covering the last N days (default: 30)')
+        parser.add_argument('--location', type=int, action='append', dest='locations',
+                            help='Only rebuild this location id (repeatable)')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        rebuild_rollups(since, location_ids=options['locations'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups since {since.isoformat()}"))
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from conditions.grid import get_regions, refresh_grid
+from conditions.snapshots import get_mode
+
+
+class Command(BaseCommand):
+    help = 'Fetch current weather and forecasts on the lattice of each WEATHER_GRID_REGIONS entry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--region', action='append', dest='regions',
+                            help='Only refresh this region (repeatable)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Concurrent upstream requests (default: 4)')
+
+    def handle(self, *args, **options):
+        if get_mode() != 'replay' and not getattr(settings, 'OPENWEATHERMAP_API_KEY', None):
+            raise CommandError('OPENWEATHERMAP_API_KEY is not configured')
+
+        regions = get_regions()
+        for region in options['regions'] or list(regions):
+            if region not in regions:
+                raise CommandError(f"Unknown region {region}")
+            fetched, total = refresh_grid(region, regions[region], workers=options['workers'])
+            self.stdout.write(f"{region}: fetched {fetched}/{total} nodes")
+        self.stdout.write(self.style.SUCCESS('Weather grid refreshed'))
@@ -0,0 +1,85 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from conditions.models import Location
+from conditions.views import get_rowing_conditions
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Drive the conditions endpoint at a fixed concurrency with upstream calls replayed from snapshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Total requests to send (default: 500)')
+        parser.add_argument('--concurrency', type=int,
+                            default=getattr(settings, 'CONDITIONS_MAX_IN_FLIGHT', 32),
+                            help='Requests in flight at once (default: CONDITIONS_MAX_IN_FLIGHT)')
+        parser.add_argument('--location', type=int, action='append', dest='locations',
+                            help='Only request this location id (repeatable, default: all)')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep the in-process weather/geocode caches, so only the first request per point '
+                                 'replays upstream (default: every request replays upstream)')
+
+    def handle(self, *args, **options):
+        locations = Location.objects.all()
+        if options['locations']:
+            locations = locations.filter(id__in=options['locations'])
+        points = list(locations.values_list('latitude', 'longitude'))
+        if not points:
+            raise CommandError('No locations to request, record some traffic first')
+
+        factory = APIRequestFactory()
+
+        def send(index):
+            lat, lng = points[index % len(points)]
+            request = factory.post(
+                '/api/conditions/', {'latitude': str(lat), 'longitude': str(lng)}, format='json'
+            )
+            started = time.perf_counter()
+            try:
+                response = get_rowing_conditions(request)
+            finally:
+                # As at the end of a real request; also stops pool threads leaking connections
+                connection.close()
+            elapsed = time.perf_counter() - started
+            sections = response.data.get('status', {}) if response.status_code == 200 else {}
+            return elapsed, response.status_code, sections
+
+        replay = {'UPSTREAM_SNAPSHOT_MODE': 'replay'}
+        if not options['warm_cache']:
+            # A zero lifetime turns every cache lookup into a miss. Reverse geocoding
+            # still only runs for points that have no Location yet.
+            replay.update(WEATHER_CACHE_SECONDS=0, GEOCODE_CACHE_SECONDS=0)
+
+        with override_settings(**replay):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(send, range(options['requests'])))
+            wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for elapsed, _, _ in results)
+        statuses = Counter(code for _, code, _ in results)
+        fallbacks = Counter(
+            f"{section}={state}"
+            for _, _, sections in results
+            for section, state in sections.items() if state != 'ok'
+        )
+
+        self.stdout.write(f"{len(results)} requests in {wall:.2f}s ({len(results) / wall:.1f}/s)")
+        self.stdout.write(
+            f"latency ms: p50 {percentile(latencies, 0.5):.1f}  p95 {percentile(latencies, 0.95):.1f}  "
+            f"p99 {percentile(latencies, 0.99):.1f}  max {latencies[-1]:.1f}"
+        )
+        self.stdout.write('status codes: ' + ', '.join(f"{code} x{count}" for code, count in sorted(statuses.items())))
+        if fallbacks:
+            self.stdout.write('fallbacks: ' + ', '.join(f"{name} x{count}" for name, count in sorted(fallbacks.items())))
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConditionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('sample_count', models.IntegerField(default=0)),
+                ('wind_speed_min', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('wind_speed_max', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('wind_speed_sum', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('wind_gust_max', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('score_count', models.IntegerField(default=0)),
+                ('rowable_count', models.IntegerField(default=0)),
+                ('rowable_hours', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='condition_rollups', to='conditions.location')),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'unique_together': {('location', 'period', 'period_start')},
+            },
+        ),
+    ]
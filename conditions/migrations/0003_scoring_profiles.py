@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0002_condition_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoringProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.CharField(max_length=20, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('rules', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['slug'],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0003_scoring_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Watchlist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('webhook_url', models.URLField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Watch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile', models.CharField(default='default', max_length=20)),
+                ('notify_at_or_above', models.CharField(choices=[('excellent', 'Excellent'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('dangerous', 'Dangerous')], default='good', max_length=20)),
+                ('notify_at_or_below', models.CharField(choices=[('excellent', 'Excellent'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('dangerous', 'Dangerous')], default='dangerous', max_length=20)),
+                ('last_category', models.CharField(blank=True, choices=[('excellent', 'Excellent'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('dangerous', 'Dangerous')], max_length=20)),
+                ('last_outlook_category', models.CharField(blank=True, choices=[('excellent', 'Excellent'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('dangerous', 'Dangerous')], max_length=20)),
+                ('last_evaluated_at', models.DateTimeField(blank=True, null=True)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watches', to='conditions.location')),
+                ('watchlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watches', to='conditions.watchlist')),
+            ],
+            options={
+                'verbose_name_plural': 'watches',
+                'unique_together': {('watchlist', 'location', 'profile')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0004_watchlists'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='timezone',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0005_location_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestCondition',
+            fields=[
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_condition', serialize=False, to='conditions.location')),
+                ('name', models.CharField(max_length=255)),
+                ('latitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('longitude', models.DecimalField(decimal_places=6, max_digits=9)),
+                ('observed_at', models.DateTimeField(blank=True, null=True)),
+                ('wind_speed', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('wind_gust', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('temperature', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('scored_at', models.DateTimeField(blank=True, null=True)),
+                ('score', models.CharField(blank=True, choices=[('excellent', 'Excellent'), ('good', 'Good'), ('fair', 'Fair'), ('poor', 'Poor'), ('dangerous', 'Dangerous')], max_length=20)),
+                ('score_value', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['latitude', 'longitude'], name='latest_condition_bbox')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0006_latest_conditions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forecast',
+            index=models.Index(fields=['forecast_date', 'forecast_time'], name='forecast_slot'),
+        ),
+        migrations.AddIndex(
+            model_name='rowabilityscore',
+            index=models.Index(fields=['-timestamp'], name='score_timestamp_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='rowabilityscore',
+            index=models.Index(fields=['score', '-timestamp'], name='score_category_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='watercondition',
+            index=models.Index(fields=['-timestamp'], name='water_timestamp_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='watercondition',
+            index=models.Index(fields=['tide_type', '-timestamp'], name='water_tide_type_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='weathercondition',
+            index=models.Index(fields=['-timestamp'], name='weather_timestamp_desc'),
+        ),
+    ]
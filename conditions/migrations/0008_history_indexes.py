@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conditions', '0007_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='forecast',
+            index=models.Index(fields=['created_at', 'location'], name='forecast_created'),
+        ),
+        migrations.AddIndex(
+            model_name='weathercondition',
+            index=models.Index(fields=['created_at', 'location'], name='weather_created'),
+        ),
+    ]
@@ -9,6 +9,7 @@ class Location(models.Model):
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
     waterway_type = models.CharField(max_length=100, blank=True)  # river, lake, sea, etc.
     nearest_town = models.CharField(max_length=255, blank=True)
+    timezone = models.CharField(max_length=64, blank=True)  # IANA name, blank uses CONDITIONS_DEFAULT_TIMEZONE
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -37,7 +38,11 @@ class WeatherCondition(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
-        unique_together = ['location', 'timestamp']
+        unique_together = ['location', 'timestamp']  # its index also serves per-location history
+        indexes = [
+            models.Index(fields=['-timestamp'], name='weather_timestamp_desc'),  # admin listing and date_hierarchy
+            models.Index(fields=['created_at', 'location'], name='weather_created'),  # watchlist change scans
+        ]
 
     def __str__(self):
         return f"{self.location.name} - {self.timestamp}"
@@ -56,7 +61,11 @@ class WaterCondition(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
-        unique_together = ['location', 'timestamp']
+        unique_together = ['location', 'timestamp']  # its index also serves per-location history
+        indexes = [
+            models.Index(fields=['-timestamp'], name='water_timestamp_desc'),
+            models.Index(fields=['tide_type', '-timestamp'], name='water_tide_type_timestamp'),
+        ]
 
     def __str__(self):
         return f"{self.location.name} - {self.timestamp}"
@@ -82,7 +91,11 @@ class RowabilityScore(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
-        unique_together = ['location', 'timestamp']
+        unique_together = ['location', 'timestamp']  # its index also serves per-location history
+        indexes = [
+            models.Index(fields=['-timestamp'], name='score_timestamp_desc'),
+            models.Index(fields=['score', '-timestamp'], name='score_category_timestamp'),
+        ]
 
     def __str__(self):
         return f"{self.location.name} - {self.timestamp} - {self.score}"
@@ -105,7 +118,138 @@ class Forecast(models.Model):
 
     class Meta:
         ordering = ['forecast_date', 'forecast_time']
-        unique_together = ['location', 'forecast_date', 'forecast_time']
+        unique_together = ['location', 'forecast_date', 'forecast_time']  # its index also serves per-location history
+        indexes = [
+            models.Index(fields=['forecast_date', 'forecast_time'], name='forecast_slot'),
+            models.Index(fields=['created_at', 'location'], name='forecast_created'),
+        ]
 
     def __str__(self):
         return f"{self.location.name} - {self.forecast_date} {self.forecast_time}"
+
+
+class ConditionRollup(models.Model):
+    """Model for storing hourly and daily aggregates of observed conditions"""
+    PERIOD_HOUR = 'hour'
+    PERIOD_DAY = 'day'
+    PERIOD_CHOICES = [
+        (PERIOD_HOUR, 'Hourly'),
+        (PERIOD_DAY, 'Daily'),
+    ]
+
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='condition_rollups')
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateTimeField()  # UTC bucket start
+    sample_count = models.IntegerField(default=0)  # weather observations in bucket
+    wind_speed_min = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)  # in m/s
+    wind_speed_max = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)  # in m/s
+    wind_speed_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)  # for the running mean
+    wind_gust_max = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)  # in m/s
+    score_count = models.IntegerField(default=0)  # rowability scores in bucket
+    rowable_count = models.IntegerField(default=0)  # scores at or above the rowable threshold
+    rowable_hours = models.IntegerField(default=0)  # hours with a rowable verdict (0 or 1 for hourly rows)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-period_start']
+        unique_together = ['location', 'period', 'period_start']
+
+    def __str__(self):
+        return f"{self.location.name} - {self.period} {self.period_start}"
+
+    @property
+    def wind_speed_mean(self):
+        if not self.sample_count:
+            return None
+        return round(self.wind_speed_sum / self.sample_count, 1)
+
+    @property
+    def hours_rowable(self):
+        """Hours in the bucket whose scores were mostly rowable"""
+        return self.rowable_hours
+
+
+class ScoringProfile(models.Model):
+    """Model for storing boat-class scoring profiles (rule overrides for rowability scoring)"""
+    slug = models.CharField(max_length=20, unique=True)  # e.g. 1x, 8+, coastal
+    name = models.CharField(max_length=100)
+    rules = models.JSONField(default=dict, blank=True)  # overrides of conditions.scoring.DEFAULT_RULES
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['slug']
+
+    def __str__(self):
+        return f"{self.name} ({self.slug})"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .scoring import CompiledRules
+
+        try:
+            CompiledRules(self.rules)
+        except (TypeError, ValueError) as e:
+            raise ValidationError({'rules': str(e)})
+
+
+class Watchlist(models.Model):
+    """Model for storing a saved set of watched locations and where to notify"""
+    name = models.CharField(max_length=255)
+    email = models.EmailField(blank=True)
+    webhook_url = models.URLField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Watch(models.Model):
+    """Model for storing a watched location with its notification thresholds"""
+    CATEGORY_CHOICES = RowabilityScore.SCORE_CHOICES
+
+    watchlist = models.ForeignKey(Watchlist, on_delete=models.CASCADE, related_name='watches')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='watches')
+    profile = models.CharField(max_length=20, default='default')  # scoring profile slug
+    notify_at_or_above = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='good')
+    notify_at_or_below = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='dangerous')
+    last_category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, blank=True)  # latest observation
+    last_outlook_category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, blank=True)  # worst forecast slot
+    last_evaluated_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['watchlist', 'location', 'profile']
+        verbose_name_plural = 'watches'
+
+    def __str__(self):
+        return f"{self.watchlist.name} - {self.location.name} ({self.profile})"
+
+
+class LatestCondition(models.Model):
+    """
+    Model for storing each location's newest observation and score, denormalized for map queries.
+
+    Only the post_save signals in signals.py keep these rows current. Writes that skip them
+    (bulk_create, QuerySet.update, loaddata, raw SQL) leave the map stale until
+    rebuild_latest_conditions runs; import_archive runs it itself.
+    """
+    location = models.OneToOneField(Location, on_delete=models.CASCADE, primary_key=True, related_name='latest_condition')
+    name = models.CharField(max_length=255)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    observed_at = models.DateTimeField(null=True, blank=True)  # timestamp of the newest WeatherCondition
+    wind_speed = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)  # in m/s
+    wind_gust = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)  # in m/s
+    temperature = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)  # in Celsius
+    scored_at = models.DateTimeField(null=True, blank=True)  # timestamp of the newest RowabilityScore
+    score = models.CharField(max_length=20, choices=RowabilityScore.SCORE_CHOICES, blank=True)
+    score_value = models.IntegerField(null=True, blank=True)  # 1-10 scale
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='latest_condition_bbox'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.score or 'unscored'}"
@@ -0,0 +1,69 @@
+"""
+Notification sinks for watchlist alerts.
+
+Sinks are configured in settings.WATCHLIST_NOTIFICATION_SINKS as a list of
+{'BACKEND': dotted path, 'OPTIONS': {...}} entries. Each sink receives
+every notification and decides whether it applies to the watchlist.
+"""
+import json
+import threading
+
+import requests
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils.module_loading import import_string
+
+
+class NotificationSink:
+    """Base class for notification sinks"""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, watchlist, notification):
+        raise NotImplementedError
+
+
+class EmailSink(NotificationSink):
+    """Email the watchlist's address, if it has one"""
+
+    def send(self, watchlist, notification):
+        if not watchlist.email:
+            return
+        send_mail(
+            subject=notification['message'],
+            message=json.dumps(notification, indent=2),
+            from_email=self.options.get('from_email'),
+            recipient_list=[watchlist.email],
+            fail_silently=True,
+        )
+
+
+class WebhookSink(NotificationSink):
+    """POST the notification as JSON to the watchlist's webhook, if it has one"""
+
+    def send(self, watchlist, notification):
+        if not watchlist.webhook_url:
+            return
+        try:
+            requests.post(watchlist.webhook_url, json=notification, timeout=self.options.get('timeout', 5))
+        except requests.RequestException as e:
+            print(f"Error posting watchlist webhook: {e}")
+
+
+class FileSink(NotificationSink):
+    """Append notifications as JSON lines to a local file (handy for tests and debugging)"""
+
+    _lock = threading.Lock()
+
+    def send(self, watchlist, notification):
+        line = json.dumps({'watchlist': watchlist.id, **notification})
+        with self._lock, open(self.options['path'], 'a') as handle:
+            handle.write(line + '\n')
+
+
+def get_sinks():
+    return [
+        import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        for config in getattr(settings, 'WATCHLIST_NOTIFICATION_SINKS', [])
+    ]
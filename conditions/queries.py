@@ -0,0 +1,161 @@
+"""
+Shared query layer for per-location condition history.
+
+Every query here is shaped to be answered from the indexes behind the
+(location, time) unique_together constraints on the condition models:
+equality on location_id, then a range and ORDER BY on the time columns. Pages are fetched by seeking past
+a cursor (keyset pagination) rather than with OFFSET, so deep pages cost
+the same as the first. tests.py checks the plans with EXPLAIN.
+"""
+import base64
+import json
+from datetime import date, datetime, time
+
+from django.db.models import OuterRef, Q, Subquery
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+
+from .models import ConditionRollup, Forecast, RowabilityScore, WaterCondition, WeatherCondition
+
+
+# Columns that order each model's rows in time; unique per location (per period for rollups)
+TIME_FIELDS = {
+    WeatherCondition: ('timestamp',),
+    WaterCondition: ('timestamp',),
+    RowabilityScore: ('timestamp',),
+    Forecast: ('forecast_date', 'forecast_time'),
+    ConditionRollup: ('period_start',),
+}
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def time_fields(model):
+    return TIME_FIELDS[model]
+
+
+def _cursor_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime, time)) else value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_cursor_value(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model):
+    """
+    Return the time field values encoded in cursor, parsed to the model's field types
+    """
+    fields = time_fields(model)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as e:
+        raise InvalidCursor(f"Malformed cursor: {e}")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor('Cursor does not match this history')
+
+    parsers = {'DateTimeField': parse_datetime, 'DateField': parse_date, 'TimeField': parse_time}
+    parsed = []
+    for name, value in zip(fields, values):
+        parser = parsers[model._meta.get_field(name).get_internal_type()]
+        try:
+            value = parser(value) if isinstance(value, str) else None
+        except ValueError:
+            value = None
+        if value is None:
+            raise InvalidCursor(f"Cursor has an invalid {name}")
+        parsed.append(value)
+    return parsed
+
+
+def location_rows(model, location, start=None, end=None):
+    """
+    Return a location's rows with time in [start, end), either bound optional.
+
+    Forecasts are bounded by forecast_date, so start and end are dates there.
+    """
+    queryset = model.objects.filter(location=location)
+    field = time_fields(model)[0]
+    if start is not None:
+        queryset = queryset.filter(**{f"{field}__gte": start})
+    if end is not None:
+        queryset = queryset.filter(**{f"{field}__lt": end})
+    return queryset
+
+
+def ordered(queryset, descending=False):
+    fields = time_fields(queryset.model)
+    return queryset.order_by(*(f"-{field}" if descending else field for field in fields))
+
+
+def seek(queryset, values, descending=False):
+    """
+    Filter an ordered queryset to rows strictly after the time values of a cursor
+    """
+    fields = time_fields(queryset.model)
+    operator = 'lt' if descending else 'gt'
+    after = Q()
+    for index, field in enumerate(fields):
+        after |= Q(**{f"{field}__{operator}": values[index]}, **dict(zip(fields[:index], values[:index])))
+    # Bounding the leading column too keeps the whole condition an index range
+    bound = Q(**{f"{fields[0]}__{operator}e": values[0]})
+    return queryset.filter(bound, after)
+
+
+def recent(model, location, limit, fields=None):
+    """
+    Return a location's newest limit rows, newest first, loading only fields if given
+    """
+    queryset = ordered(location_rows(model, location), descending=True)
+    if fields:
+        queryset = queryset.only(*fields)
+    return queryset[:limit]
+
+
+def upcoming_forecasts(location, today, limit):
+    """
+    Return a location's forecast slots from today onwards, soonest first
+    """
+    return ordered(location_rows(Forecast, location, start=today))[:limit]
+
+
+def latest_rows(model, location_ids):
+    """
+    Return the newest row of each location, found with one indexed lookup per location
+    """
+    newest = ordered(model.objects.filter(location_id=OuterRef('location_id')), descending=True).values('pk')[:1]
+    return model.objects.filter(location_id__in=location_ids, pk=Subquery(newest)).order_by()
+
+
+def latest_values(model, location_ids, fields):
+    """
+    Map location id -> dict of fields from its newest row
+    """
+    return {row['location_id']: row for row in latest_rows(model, location_ids).values('location_id', *fields)}
+
+
+def history_page(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE, descending=False):
+    """
+    Return (rows, next cursor or None) for one page of a location history queryset.
+
+    queryset may yield model instances or values() dicts; either way the
+    time fields must be among the loaded columns.
+    """
+    model = queryset.model
+    fields = time_fields(model)
+    queryset = ordered(queryset, descending)
+    if cursor:
+        queryset = seek(queryset, decode_cursor(cursor, model), descending)
+
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    values = [last[field] if isinstance(last, dict) else getattr(last, field) for field in fields]
+    return rows, encode_cursor(values)
@@ -0,0 +1,325 @@
+"""
+Hourly/daily rollups of observed conditions and raw-row retention.
+
+Rollups are maintained incrementally as WeatherCondition and RowabilityScore
+rows are created (see signals.py), so history queries over long windows can
+read a handful of aggregate rows instead of scanning raw observations.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import ConditionRollup, RowabilityScore, WeatherCondition
+
+
+HOUR = ConditionRollup.PERIOD_HOUR
+DAY = ConditionRollup.PERIOD_DAY
+
+DEFAULT_RETENTION_DAYS = {
+    'raw': 30,
+    HOUR: 365,
+    DAY: None,
+}
+
+# Longest window (in days) each tier is used for before falling back to a coarser one
+TIER_MAX_WINDOW_DAYS = {
+    'raw': 2,
+    HOUR: 31,
+}
+
+RETENTION_BATCH_SIZE = 5000
+
+
+def get_retention_days():
+    retention = dict(DEFAULT_RETENTION_DAYS)
+    retention.update(getattr(settings, 'CONDITIONS_RETENTION_DAYS', {}))
+    return retention
+
+
+def get_rowable_threshold():
+    return getattr(settings, 'ROWABLE_SCORE_THRESHOLD', 6)
+
+
+def hour_is_rowable(score_count, rowable_count):
+    """
+    An hour is rowable when at least half of its scores are
+    """
+    return int(bool(score_count) and 2 * rowable_count >= score_count)
+
+
+def bucket_start(timestamp, period):
+    """
+    Return the UTC start of the hour or day bucket containing timestamp
+    """
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+    if period == DAY:
+        timestamp = timestamp.replace(hour=0)
+    return timestamp
+
+
+def _bump_rollup(location_id, timestamp, defaults, updates):
+    for period in (HOUR, DAY):
+        rollup, created = ConditionRollup.objects.get_or_create(
+            location_id=location_id,
+            period=period,
+            period_start=bucket_start(timestamp, period),
+            defaults=defaults,
+        )
+        if not created:
+            ConditionRollup.objects.filter(pk=rollup.pk).update(**updates)
+
+
+def record_weather_condition(condition):
+    """
+    Fold a newly stored WeatherCondition into its hourly and daily rollups
+    """
+    wind_speed = condition.wind_speed
+    wind_gust = condition.wind_gust
+    updates = {
+        'sample_count': F('sample_count') + 1,
+        'wind_speed_sum': F('wind_speed_sum') + wind_speed,
+        'wind_speed_min': Least(Coalesce('wind_speed_min', Value(wind_speed)), Value(wind_speed)),
+        'wind_speed_max': Greatest(Coalesce('wind_speed_max', Value(wind_speed)), Value(wind_speed)),
+        'updated_at': timezone.now(),
+    }
+    if wind_gust is not None:
+        updates['wind_gust_max'] = Greatest(Coalesce('wind_gust_max', Value(wind_gust)), Value(wind_gust))
+
+    defaults = {
+        'sample_count': 1,
+        'wind_speed_sum': wind_speed,
+        'wind_speed_min': wind_speed,
+        'wind_speed_max': wind_speed,
+        'wind_gust_max': wind_gust,
+    }
+    _bump_rollup(condition.location_id, condition.timestamp, defaults, updates)
+
+
+def record_rowability_score(score):
+    """
+    Fold a newly stored RowabilityScore into its hourly and daily rollups
+    """
+    rowable = int(score.score_value >= get_rowable_threshold())
+    hour, created = ConditionRollup.objects.get_or_create(
+        location_id=score.location_id,
+        period=HOUR,
+        period_start=bucket_start(score.timestamp, HOUR),
+        defaults={'score_count': 1, 'rowable_count': rowable, 'rowable_hours': rowable},
+    )
+    if created:
+        change = rowable
+    else:
+        ConditionRollup.objects.filter(pk=hour.pk).update(
+            score_count=F('score_count') + 1,
+            rowable_count=F('rowable_count') + rowable,
+            updated_at=timezone.now(),
+        )
+        hour.refresh_from_db(fields=['score_count', 'rowable_count', 'rowable_hours'])
+        verdict = hour_is_rowable(hour.score_count, hour.rowable_count)
+        change = verdict - hour.rowable_hours
+        if change:
+            ConditionRollup.objects.filter(pk=hour.pk).update(rowable_hours=verdict)
+
+    # The day counts the hours whose verdict is rowable, so it moves by the hour's change
+    day, created = ConditionRollup.objects.get_or_create(
+        location_id=score.location_id,
+        period=DAY,
+        period_start=bucket_start(score.timestamp, DAY),
+        defaults={'score_count': 1, 'rowable_count': rowable, 'rowable_hours': change},
+    )
+    if not created:
+        ConditionRollup.objects.filter(pk=day.pk).update(
+            score_count=F('score_count') + 1,
+            rowable_count=F('rowable_count') + rowable,
+            rowable_hours=F('rowable_hours') + change,
+            updated_at=timezone.now(),
+        )
+
+
+def _upsert_rollups(period, rows):
+    for row in rows:
+        ConditionRollup.objects.update_or_create(
+            location_id=row.pop('location_id'),
+            period=period,
+            period_start=row.pop('bucket'),
+            defaults=row,
+        )
+
+
+def _first_bucket_after(cutoff, period):
+    start = bucket_start(cutoff, period)
+    if start < cutoff:
+        start += timedelta(days=1) if period == DAY else timedelta(hours=1)
+    return start
+
+
+@transaction.atomic
+def rebuild_rollups(since, location_ids=None, now=None):
+    """
+    Recompute rollups from stored rows for buckets starting at or after since.
+
+    Hourly buckets are rebuilt from raw rows and daily buckets from the
+    hourly ones. Buckets whose source rows may already have been pruned by
+    the retention policy are left alone: hourly rebuilds start at the first
+    full hour of retained raw rows and daily rebuilds at the first full day
+    of retained hourly rollups, so older aggregates are never lost.
+    """
+    now = now or timezone.now()
+    retention = get_retention_days()
+    since_hour = bucket_start(since, HOUR)
+    since_day = bucket_start(since, DAY)
+    if retention['raw'] is not None:
+        since_hour = max(since_hour, _first_bucket_after(now - timedelta(days=retention['raw']), HOUR))
+    if retention[HOUR] is not None:
+        since_day = max(since_day, _first_bucket_after(now - timedelta(days=retention[HOUR]), DAY))
+    threshold = get_rowable_threshold()
+
+    weather = WeatherCondition.objects.filter(timestamp__gte=since_hour)
+    scores = RowabilityScore.objects.filter(timestamp__gte=since_hour)
+    hourly = ConditionRollup.objects.filter(period=HOUR, period_start__gte=since_day)
+    if location_ids is not None:
+        weather = weather.filter(location_id__in=location_ids)
+        scores = scores.filter(location_id__in=location_ids)
+        hourly = hourly.filter(location_id__in=location_ids)
+
+    stale = ConditionRollup.objects.filter(
+        Q(period=HOUR, period_start__gte=since_hour) | Q(period=DAY, period_start__gte=since_day)
+    )
+    if location_ids is not None:
+        stale = stale.filter(location_id__in=location_ids)
+    stale.delete()
+
+    # Weather and score rows land in the same hourly buckets, so merge them by key
+    buckets = {}
+    weather_rows = (
+        weather.annotate(bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .values('location_id', 'bucket')
+        .annotate(
+            sample_count=Count('id'),
+            wind_speed_sum=Sum('wind_speed'),
+            wind_speed_min=Min('wind_speed'),
+            wind_speed_max=Max('wind_speed'),
+            wind_gust_max=Max('wind_gust'),
+        )
+        .order_by()
+    )
+    for row in weather_rows:
+        buckets[(row['location_id'], row['bucket'])] = row
+    score_rows = (
+        scores.annotate(bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .values('location_id', 'bucket')
+        .annotate(
+            score_count=Count('id'),
+            rowable_count=Count('id', filter=Q(score_value__gte=threshold)),
+        )
+        .order_by()
+    )
+    for row in score_rows:
+        key = (row['location_id'], row['bucket'])
+        row['rowable_hours'] = hour_is_rowable(row['score_count'], row['rowable_count'])
+        buckets.setdefault(key, {'location_id': key[0], 'bucket': key[1]}).update(row)
+    _upsert_rollups(HOUR, buckets.values())
+
+    daily_rows = (
+        hourly.annotate(bucket=TruncDay('period_start', tzinfo=dt_timezone.utc))
+        .values('location_id', 'bucket')
+        .annotate(
+            sample_count=Sum('sample_count'),
+            wind_speed_sum=Sum('wind_speed_sum'),
+            wind_speed_min=Min('wind_speed_min'),
+            wind_speed_max=Max('wind_speed_max'),
+            wind_gust_max=Max('wind_gust_max'),
+            score_count=Sum('score_count'),
+            rowable_count=Sum('rowable_count'),
+            rowable_hours=Sum('rowable_hours'),
+        )
+        .order_by()
+    )
+    _upsert_rollups(DAY, list(daily_rows))
+
+
+def _delete_in_batches(queryset):
+    deleted = 0
+    while True:
+        batch = list(queryset.values_list('pk', flat=True)[:RETENTION_BATCH_SIZE])
+        if not batch:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=batch).delete()[0]
+
+
+def apply_retention(now=None):
+    """
+    Delete raw rows and hourly rollups that are older than their retention window.
+
+    Raw rows are already represented in the rollups, so pruning them only
+    drops resolution. Returns a dict of deleted row counts per table.
+    """
+    now = now or timezone.now()
+    retention = get_retention_days()
+    deleted = {}
+
+    if retention['raw'] is not None:
+        cutoff = now - timedelta(days=retention['raw'])
+        deleted['weather_conditions'] = _delete_in_batches(
+            WeatherCondition.objects.filter(timestamp__lt=cutoff)
+        )
+        deleted['rowability_scores'] = _delete_in_batches(
+            RowabilityScore.objects.filter(timestamp__lt=cutoff)
+        )
+
+    for period in (HOUR, DAY):
+        if retention[period] is not None:
+            cutoff = now - timedelta(days=retention[period])
+            deleted[f'{period}_rollups'] = _delete_in_batches(
+                ConditionRollup.objects.filter(period=period, period_start__lt=cutoff)
+            )
+
+    return deleted
+
+
+def history_tier(start, end, now=None):
+    """
+    Pick the tier to answer a history query for the window [start, end).
+
+    Short windows read raw rows, longer ones the hourly and then the daily
+    rollups. A tier is only used if its retention still covers start.
+    """
+    now = now or timezone.now()
+    retention = get_retention_days()
+    window = end - start
+
+    for tier in ('raw', HOUR):
+        kept = retention[tier]
+        if kept is not None and start < now - timedelta(days=kept):
+            continue
+        if window <= timedelta(days=TIER_MAX_WINDOW_DAYS[tier]):
+            return tier
+    return DAY
+
+
+def condition_history(location, start, end):
+    """
+    Return (tier, queryset) for a location's conditions between start and end
+    """
+    tier = history_tier(start, end)
+    if tier == 'raw':
+        queryset = WeatherCondition.objects.filter(
+            location=location, timestamp__gte=start, timestamp__lt=end
+        )
+    else:
+        queryset = ConditionRollup.objects.filter(
+            location=location,
+            period=tier,
+            period_start__gte=bucket_start(start, tier),
+            period_start__lt=end,
+        ).only(
+            # What ConditionRollupSerializer and its computed fields read
+            'period', 'period_start', 'sample_count', 'wind_speed_min', 'wind_speed_max',
+            'wind_speed_sum', 'wind_gust_max', 'rowable_hours',
+        )
+    return tier, queryset
@@ -0,0 +1,287 @@
+"""
+Rowability rule sets and boat-class scoring profiles.
+
+The thresholds used by calculate_rowability_score are kept here as plain
+data so they can be overridden (per boat class, or from a JSON file for
+backtests) and compiled once into lookup tables that score many
+observations cheaply.
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from itertools import repeat
+
+
+CATEGORIES = ['dangerous', 'poor', 'fair', 'good', 'excellent']
+
+DEFAULT_RULES = {
+    # Upper wind speed bounds in m/s (inclusive) for light/moderate/strong wind
+    'wind_limits': [3, 6, 10],
+    # Penalty for light, moderate, strong and very strong wind
+    'wind_penalties': [0, 1, 2, 4],
+    # Gusts above wind_speed * gust_ratio count as gusty
+    'gust_ratio': 1.5,
+    'gust_penalty': 1,
+    # Comfortable and tolerable temperature ranges in Celsius (inclusive)
+    'temperature_ideal': [10, 25],
+    'temperature_tolerable': [5, 30],
+    # Penalty for tolerable and extreme temperatures
+    'temperature_penalties': [1, 2],
+    'precipitation_limit': 5,  # mm
+    'precipitation_penalty': 1,
+    'visibility_limit': 5,  # km
+    'visibility_penalty': 1,
+    'darkness_penalty': 2,  # applied when an observation is flagged as outside sunrise-sunset
+    # Minimum score for poor, fair, good and excellent
+    'category_thresholds': [2, 4, 6, 8],
+}
+
+
+class RuleError(ValueError):
+    pass
+
+
+# Rules that subtract whole points from a score; the rest are numeric thresholds
+PENALTY_RULES = {
+    'wind_penalties', 'gust_penalty', 'temperature_penalties',
+    'precipitation_penalty', 'visibility_penalty', 'darkness_penalty',
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_values(key, value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    if key in PENALTY_RULES:
+        # Floats like 2.0 from JSON are fine, 1.5 would make scores fractional
+        if not all(_is_number(item) and float(item).is_integer() for item in values):
+            raise RuleError(f"{key} must be whole numbers")
+        return [int(item) for item in values] if isinstance(value, (list, tuple)) else int(value)
+    if not all(_is_number(item) for item in values):
+        raise RuleError(f"{key} must be numeric")
+    return value
+
+
+class CompiledRules:
+    """
+    A validated rule set with precomputed lookup tables
+    """
+
+    def __init__(self, rules=None):
+        if rules is not None and not isinstance(rules, dict):
+            raise RuleError('Rules must be a mapping of rule names to values')
+        merged = dict(DEFAULT_RULES)
+        merged.update(rules or {})
+        unknown = set(merged) - set(DEFAULT_RULES)
+        if unknown:
+            raise RuleError(f"Unknown rule keys: {', '.join(sorted(unknown))}")
+        for key, default in DEFAULT_RULES.items():
+            if isinstance(merged[key], (list, tuple)) != isinstance(default, list):
+                raise RuleError(f"{key} must be {'a list' if isinstance(default, list) else 'a single value'}")
+            merged[key] = _check_values(key, merged[key])
+        if len(merged['wind_limits']) != 3 or len(merged['wind_penalties']) != 4:
+            raise RuleError('wind_limits needs 3 bounds and wind_penalties 4 penalties')
+        if sorted(merged['wind_limits']) != list(merged['wind_limits']):
+            raise RuleError('wind_limits must be ascending')
+        if len(merged['category_thresholds']) != 4:
+            raise RuleError('category_thresholds needs 4 values')
+        for key in ('temperature_ideal', 'temperature_tolerable', 'temperature_penalties'):
+            if len(merged[key]) != 2:
+                raise RuleError(f"{key} needs 2 values")
+        self.rules = merged
+
+        self.wind_limits = list(merged['wind_limits'])
+        self.wind_penalties = list(merged['wind_penalties'])
+        self.gust_ratio = float(merged['gust_ratio'])
+        self.gust_penalty = merged['gust_penalty']
+        self.ideal_low, self.ideal_high = merged['temperature_ideal']
+        self.tolerable_low, self.tolerable_high = merged['temperature_tolerable']
+        self.temperature_penalties = [0] + list(merged['temperature_penalties'])
+        self.precipitation_limit = merged['precipitation_limit']
+        self.precipitation_penalty = merged['precipitation_penalty']
+        self.visibility_limit = merged['visibility_limit']
+        self.visibility_penalty = merged['visibility_penalty']
+        self.darkness_penalty = merged['darkness_penalty']
+
+        # Scores are clamped to 1-10, so categories are a plain index lookup
+        thresholds = merged['category_thresholds']
+        self.category_table = [CATEGORIES[bisect_left(thresholds, score + 0.5)] for score in range(11)]
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path) as handle:
+            return cls(json.load(handle))
+
+    def wind_band(self, wind_speed):
+        """Index of the wind band: 0 light, 1 moderate, 2 strong, 3 very strong"""
+        return bisect_left(self.wind_limits, wind_speed)
+
+    def is_gusty(self, wind_speed, wind_gust):
+        return bool(wind_gust) and float(wind_gust) > float(wind_speed) * self.gust_ratio
+
+    def temperature_band(self, temperature):
+        """Index of the temperature band: 0 ideal, 1 tolerable, 2 extreme"""
+        if self.ideal_low <= temperature <= self.ideal_high:
+            return 0
+        if self.tolerable_low <= temperature <= self.tolerable_high:
+            return 1
+        return 2
+
+    def score(self, wind_speed, wind_gust=None, temperature=20, precipitation=0, visibility=None, daylight=True):
+        """
+        Score a single observation without building factors or recommendations
+        """
+        score = 10 - self.wind_penalties[bisect_left(self.wind_limits, wind_speed)]
+        if self.is_gusty(wind_speed, wind_gust):
+            score -= self.gust_penalty
+        score -= self.temperature_penalties[self.temperature_band(temperature)]
+        if precipitation > self.precipitation_limit:
+            score -= self.precipitation_penalty
+        if visibility and visibility < self.visibility_limit:
+            score -= self.visibility_penalty
+        if not daylight:
+            score -= self.darkness_penalty
+        return max(1, min(10, score))
+
+    def score_batch(self, wind_speed, wind_gust, temperature, precipitation, visibility, daylight=None):
+        """
+        Score equal-length columns of observations, one score() call per row.
+
+        Archive columns mark missing gust or visibility with NaN, which
+        score() already treats as absent: NaN is truthy but fails every
+        comparison, so neither penalty applies. Without a daylight column
+        every row is scored as daylight.
+        """
+        if daylight is None:
+            daylight = repeat(True)
+        return list(map(self.score, wind_speed, wind_gust, temperature, precipitation, visibility, daylight))
+
+    def category(self, score):
+        return self.category_table[score]
+
+
+DEFAULT_SCORING = CompiledRules()
+
+
+DEFAULT_PROFILE = 'default'
+
+
+class ProfileRegistry:
+    """
+    Compiled scoring profiles by slug.
+
+    Profiles come from settings.SCORING_PROFILES and the ScoringProfile
+    table (database rows win). Lookups are a dict access; the table is
+    re-checked for edits at most every SCORING_PROFILE_RELOAD_SECONDS, and
+    saves in this process invalidate the registry immediately.
+    """
+
+    def __init__(self):
+        self._profiles = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _config_profiles(self):
+        from django.conf import settings
+
+        profiles = {DEFAULT_PROFILE: DEFAULT_SCORING}
+        for slug, rules in getattr(settings, 'SCORING_PROFILES', {}).items():
+            profiles[slug] = CompiledRules(rules)
+        return profiles
+
+    def _db_version(self):
+        from django.db import DatabaseError
+        from django.db.models import Count, Max
+        from .models import ScoringProfile
+
+        try:
+            stats = ScoringProfile.objects.aggregate(updated=Max('updated_at'), count=Count('id'))
+        except DatabaseError:
+            return None
+        return (stats['updated'], stats['count'])
+
+    def _load(self, version):
+        from .models import ScoringProfile
+
+        profiles = self._config_profiles()
+        if version is not None:
+            for slug, rules in ScoringProfile.objects.values_list('slug', 'rules'):
+                try:
+                    profiles[slug] = CompiledRules(rules)
+                except (TypeError, ValueError) as e:
+                    print(f"Skipping invalid scoring profile {slug}: {e}")
+        return profiles
+
+    def _refresh(self):
+        from django.conf import settings
+
+        interval = getattr(settings, 'SCORING_PROFILE_RELOAD_SECONDS', 30)
+        now = time.monotonic()
+        if self._profiles is not None and now - self._checked_at < interval:
+            return self._profiles
+
+        with self._lock:
+            if self._profiles is None or now - self._checked_at >= interval:
+                version = self._db_version()
+                if self._profiles is None or version != self._version:
+                    self._profiles = self._load(version)
+                    self._version = version
+                self._checked_at = now
+        return self._profiles
+
+    def get(self, slug=None):
+        """
+        Return the CompiledRules for slug, or None if there is no such profile
+        """
+        return self._refresh().get(slug or DEFAULT_PROFILE)
+
+    def slugs(self):
+        return sorted(self._refresh())
+
+    def invalidate(self):
+        self._checked_at = 0.0
+        self._version = None
+
+    def export(self):
+        """
+        Return the loaded profiles and table version as JSON-able data, or None if not loaded
+        """
+        loaded, version = self._profiles, self._version
+        if loaded is None:
+            return None
+        return {
+            'version': [version[0].isoformat() if version[0] else None, version[1]] if version else None,
+            'rules': {slug: rules.rules for slug, rules in loaded.items()},
+        }
+
+    def prime(self, exported, age):
+        """
+        Install profiles from export() taken age seconds ago, unless some are already loaded.
+
+        The table is re-checked once the reload interval since the export has
+        passed, as if this process had loaded the profiles itself.
+        """
+        from datetime import datetime
+
+        with self._lock:
+            if self._profiles is not None:
+                return False
+            try:
+                loaded = {slug: CompiledRules(rules) for slug, rules in exported['rules'].items()}
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Skipping saved scoring profiles: {e}")
+                return False
+            version = exported.get('version')
+            if version:
+                version = (datetime.fromisoformat(version[0]) if version[0] else None, version[1])
+            self._profiles = loaded
+            self._version = version
+            self._checked_at = time.monotonic() - age
+        return True
+
+
+profiles = ProfileRegistry()
@@ -1,11 +1,16 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Location, WeatherCondition, WaterCondition, RowabilityScore, Forecast
+from .models import Location, WeatherCondition, WaterCondition, RowabilityScore, Forecast, ConditionRollup
+from .queries import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, recent, upcoming_forecasts
+from .scoring import DEFAULT_PROFILE, profiles
+from .solar import location_timezone
 
 
 class LocationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Location
-        fields = ['id', 'name', 'latitude', 'longitude', 'waterway_type', 'nearest_town', 'created_at']
+        fields = ['id', 'name', 'latitude', 'longitude', 'waterway_type', 'nearest_town', 'timezone', 'created_at']
 
 
 class WeatherConditionSerializer(serializers.ModelSerializer):
@@ -46,21 +51,71 @@ class ForecastSerializer(serializers.ModelSerializer):
         ]
 
 
+class ConditionRollupSerializer(serializers.ModelSerializer):
+    wind_speed_mean = serializers.DecimalField(max_digits=4, decimal_places=1, read_only=True)
+    hours_rowable = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ConditionRollup
+        fields = [
+            'period', 'period_start', 'sample_count', 'wind_speed_min', 'wind_speed_max',
+            'wind_speed_mean', 'wind_gust_max', 'hours_rowable'
+        ]
+
+
 class LocationDetailSerializer(serializers.ModelSerializer):
-    """Serializer for location with related data"""
-    weather_conditions = WeatherConditionSerializer(many=True, read_only=True)
-    water_conditions = WaterConditionSerializer(many=True, read_only=True)
-    rowability_scores = RowabilityScoreSerializer(many=True, read_only=True)
-    forecasts = ForecastSerializer(many=True, read_only=True)
+    """Serializer for location with its most recent data (LOCATION_DETAIL_RECENT_ROWS of each kind; older weather via history)"""
+    weather_conditions = serializers.SerializerMethodField()
+    water_conditions = serializers.SerializerMethodField()
+    rowability_scores = serializers.SerializerMethodField()
+    forecasts = serializers.SerializerMethodField()
     
     class Meta:
         model = Location
         fields = [
-            'id', 'name', 'latitude', 'longitude', 'waterway_type', 'nearest_town',
+            'id', 'name', 'latitude', 'longitude', 'waterway_type', 'nearest_town', 'timezone',
             'weather_conditions', 'water_conditions', 'rowability_scores', 'forecasts',
             'created_at'
         ]
 
+    def _limit(self):
+        return getattr(settings, 'LOCATION_DETAIL_RECENT_ROWS', 48)
+
+    def get_weather_conditions(self, location):
+        return WeatherConditionSerializer(recent(WeatherCondition, location, self._limit()), many=True).data
+
+    def get_water_conditions(self, location):
+        return WaterConditionSerializer(recent(WaterCondition, location, self._limit()), many=True).data
+
+    def get_rowability_scores(self, location):
+        return RowabilityScoreSerializer(recent(RowabilityScore, location, self._limit()), many=True).data
+
+    def get_forecasts(self, location):
+        # Forecast dates are local to the location
+        today = timezone.now().astimezone(location_timezone(location)).date()
+        return ForecastSerializer(upcoming_forecasts(location, today, self._limit()), many=True).data
+
+
+class ProfileField(serializers.CharField):
+    """Scoring profile slug, resolved to its compiled rules"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('default', DEFAULT_PROFILE)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        slug = super().to_internal_value(data)
+        rules = profiles.get(slug)
+        if rules is None:
+            raise serializers.ValidationError(
+                f"Unknown profile '{slug}'. Choose one of: {', '.join(profiles.slugs())}"
+            )
+        return rules
+
+    def get_default(self):
+        return profiles.get(super().get_default())
+
 
 class ConditionsRequestSerializer(serializers.Serializer):
     """Serializer for requesting conditions data"""
@@ -70,6 +125,7 @@ class ConditionsRequestSerializer(serializers.Serializer):
     include_water = serializers.BooleanField(default=True)
     include_forecast = serializers.BooleanField(default=True)
     days_ahead = serializers.IntegerField(min_value=1, max_value=7, default=7)
+    profile = ProfileField()
 
 
 class RowabilityCalculationSerializer(serializers.Serializer):
@@ -81,3 +137,38 @@ class RowabilityCalculationSerializer(serializers.Serializer):
     visibility = serializers.DecimalField(max_digits=5, decimal_places=1, required=False)
     water_level = serializers.DecimalField(max_digits=6, decimal_places=2, required=False)
     flow_rate = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    daylight = serializers.BooleanField(required=False)
+    profile = ProfileField()
+
+
+class HistoryRequestSerializer(serializers.Serializer):
+    """Serializer for querying a location's condition history"""
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField(required=False)
+    cursor = serializers.CharField(required=False)  # next_cursor from the previous page
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=MAX_PAGE_SIZE, default=DEFAULT_PAGE_SIZE)
+
+    def validate(self, attrs):
+        attrs.setdefault('end', timezone.now())
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError('start must be before end')
+        return attrs
+
+
+class ViewportRequestSerializer(serializers.Serializer):
+    """Serializer for map viewport queries"""
+    bbox = serializers.CharField()  # west,south,east,north as sent by Leaflet's toBBoxString()
+    zoom = serializers.IntegerField(min_value=0, max_value=22)
+
+    def validate_bbox(self, value):
+        try:
+            west, south, east, north = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError('bbox must be west,south,east,north')
+        if not (-90 <= south <= north <= 90):
+            raise serializers.ValidationError('bbox latitudes must satisfy -90 <= south <= north <= 90')
+        if east - west >= 360:
+            return -180.0, south, 180.0, north
+        # Leaflet reports longitudes past +/-180 once the map wraps
+        west, east = ((west + 180) % 360) - 180, ((east + 180) % 360) - 180
+        return west, south, east, north
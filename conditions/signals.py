@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import viewport
+from .models import Location, WeatherCondition, RowabilityScore, ScoringProfile
+from .rollups import record_weather_condition, record_rowability_score
+from .scoring import profiles
+from .solar import timezone_name_at
+
+
+@receiver(pre_save, sender=Location)
+def fill_location_timezone(sender, instance, raw=False, **kwargs):
+    """
+    Look up the timezone of a new location from its coordinates
+    """
+    if instance._state.adding and not instance.timezone and not raw:
+        instance.timezone = timezone_name_at(instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=Location)
+def update_latest_location(sender, instance, raw=False, **kwargs):
+    """
+    Keep the map's copy of a location's name and position current
+    """
+    if not raw:
+        viewport.record_location(instance)
+
+
+@receiver(post_save, sender=WeatherCondition)
+def update_weather_rollups(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep rollups and the latest-conditions map table current as weather observations arrive
+    """
+    if created and not raw:
+        record_weather_condition(instance)
+        viewport.record_weather_condition(instance)
+
+
+@receiver(post_save, sender=RowabilityScore)
+def update_score_rollups(sender, instance, created, raw=False, **kwargs):
+    """
+    Keep hours-rowable rollups and the latest-conditions map table current as scores arrive
+    """
+    if created and not raw:
+        record_rowability_score(instance)
+        viewport.record_rowability_score(instance)
+
+
+@receiver(post_save, sender=ScoringProfile)
+@receiver(post_delete, sender=ScoringProfile)
+def reload_scoring_profiles(sender, **kwargs):
+    """
+    Recompile scoring profiles in this process as soon as one is edited
+    """
+    profiles.invalidate()
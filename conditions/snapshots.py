@@ -0,0 +1,197 @@
+"""
+Record/replay store for upstream HTTP responses.
+
+Every OpenWeatherMap and Nominatim call goes through upstream_get. Its
+behaviour depends on settings.UPSTREAM_SNAPSHOT_MODE:
+
+- 'off':    call the network as usual
+- 'record': call the network and keep each successful (2xx) response in
+            the snapshot store; failures are returned but never stored, so
+            a 429 or 5xx cannot replace a recorded success
+- 'replay': serve responses from the store and never touch the network;
+            a request with no snapshot raises SnapshotMiss
+
+The store is a single SQLite file (UPSTREAM_SNAPSHOT_PATH) holding
+zlib-compressed bodies keyed by URL and query parameters, with API keys
+left out of both the key and the stored URL. Readers use one connection
+per thread, so replay holds up under load-test concurrency.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+
+
+MODES = ('off', 'record', 'replay')
+SECRET_PARAMS = {'appid', 'key', 'api_key'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    body BLOB NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshot_recorded_at ON snapshot (recorded_at);
+"""
+
+
+class SnapshotMiss(requests.ConnectionError):
+    """Raised in replay mode for a request that was never recorded"""
+
+
+def get_mode():
+    mode = getattr(settings, 'UPSTREAM_SNAPSHOT_MODE', 'off') or 'off'
+    if mode not in MODES:
+        raise ValueError(f"UPSTREAM_SNAPSHOT_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+    return mode
+
+
+def snapshot_url(url, params=None):
+    """
+    Canonical URL for a request: parameters sorted, secrets dropped
+    """
+    query = sorted(
+        (name, str(value))
+        for name, value in (params or {}).items()
+        if name not in SECRET_PARAMS and value is not None
+    )
+    return f"{url}?{urlencode(query)}" if query else url
+
+
+def snapshot_key(url, params=None):
+    return hashlib.sha1(snapshot_url(url, params).encode()).hexdigest()
+
+
+class SnapshotStore:
+    """SQLite-backed snapshot store, safe to share between threads"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialised = False
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            with self._init_lock:
+                if not self._initialised:
+                    # WAL lets replay readers run alongside a recording writer
+                    connection.execute('PRAGMA journal_mode=WAL')
+                    connection.executescript(SCHEMA)
+                    self._initialised = True
+            self._local.connection = connection
+        return connection
+
+    def get(self, url, params=None):
+        """
+        Return the recorded requests.Response for a request, or None
+        """
+        row = self._connection().execute(
+            'SELECT url, status, content_type, body FROM snapshot WHERE key = ?',
+            (snapshot_key(url, params),),
+        ).fetchone()
+        if row is None:
+            return None
+        response = requests.Response()
+        response.url, response.status_code = row[0], row[1]
+        response.headers['Content-Type'] = row[2]
+        response.encoding = 'utf-8'
+        response._content = zlib.decompress(row[3])
+        return response
+
+    def put(self, url, params, response):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO snapshot (key, url, status, content_type, body, recorded_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (
+                snapshot_key(url, params),
+                snapshot_url(url, params),
+                response.status_code,
+                response.headers.get('Content-Type', 'application/json'),
+                zlib.compress(response.content, 9),
+                time.time(),
+            ),
+        )
+
+    def prune(self, older_than):
+        """
+        Delete snapshots recorded before the older_than timestamp; returns the count
+        """
+        cursor = self._connection().execute('DELETE FROM snapshot WHERE recorded_at < ?', (older_than,))
+        return cursor.rowcount
+
+    def stats(self):
+        count, size, oldest, newest = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0), MIN(recorded_at), MAX(recorded_at) FROM snapshot'
+        ).fetchone()
+        return {'count': count, 'bytes': size, 'oldest': oldest, 'newest': newest}
+
+    def vacuum(self):
+        self._connection().execute('VACUUM')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    path = str(getattr(settings, 'UPSTREAM_SNAPSHOT_PATH', settings.BASE_DIR / 'snapshots.sqlite3'))
+    if _store is None or _store.path != path:
+        with _store_lock:
+            if _store is None or _store.path != path:
+                _store = SnapshotStore(path)
+    return _store
+
+
+def _read_body(response, deadline, chunk_size=16384):
+    """
+    Read a streamed response body, checking the deadline between chunks.
+
+    The requests timeout only bounds each socket read, so a server trickling
+    bytes could otherwise hold the call open indefinitely.
+    """
+    chunks = []
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            deadline.check()
+            chunks.append(chunk)
+    finally:
+        response.close()
+    response._content = b''.join(chunks)
+    response._content_consumed = True
+
+
+def upstream_get(url, params=None, timeout=None, session=None, deadline=None):
+    """
+    requests.get for upstream APIs, recording or replaying per UPSTREAM_SNAPSHOT_MODE.
+
+    With a deadline the whole call, body included, stops once it expires
+    (raising DeadlineExceeded); timeout still caps each socket wait.
+    """
+    mode = get_mode()
+    if mode == 'replay':
+        response = get_store().get(url, params)
+        if response is None:
+            raise SnapshotMiss(f"No snapshot for {snapshot_url(url, params)}")
+        return response
+
+    response = (session or requests).get(url, params=params, timeout=timeout, stream=deadline is not None)
+    if deadline is not None:
+        _read_body(response, deadline)
+    if mode == 'record' and 200 <= response.status_code < 300:
+        try:
+            get_store().put(url, params, response)
+        except sqlite3.Error as e:
+            print(f"Error recording snapshot: {e}")
+    return response
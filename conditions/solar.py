@@ -0,0 +1,160 @@
+"""
+Local sunrise, sunset and civil twilight calculations.
+
+Uses the NOAA solar equations (accurate to a minute or two at rowing
+latitudes), so sun times need no network call and are available for any
+forecast day. Results are cached per location-day.
+"""
+import math
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+
+try:
+    from timezonefinder import TimezoneFinder
+except ImportError:  # optional; without it locations use CONDITIONS_DEFAULT_TIMEZONE
+    TimezoneFinder = None
+
+
+SUNRISE_ZENITH = 90.833  # includes atmospheric refraction and the solar disc radius
+CIVIL_ZENITH = 96.0
+
+
+def get_timezone(name=None):
+    """
+    Return the ZoneInfo for name, falling back to CONDITIONS_DEFAULT_TIMEZONE and then UTC
+    """
+    for candidate in (name, getattr(settings, 'CONDITIONS_DEFAULT_TIMEZONE', None)):
+        if candidate:
+            try:
+                return ZoneInfo(candidate)
+            except (ZoneInfoNotFoundError, ValueError):
+                print(f"Unknown timezone {candidate}")
+    return dt_timezone.utc
+
+
+def location_timezone(location):
+    return get_timezone(getattr(location, 'timezone', None))
+
+
+@lru_cache(maxsize=1)
+def _timezone_finder():
+    return TimezoneFinder()
+
+
+def timezone_name_at(latitude, longitude):
+    """
+    Return the IANA timezone name at a point, or '' if unknown or timezonefinder is not installed
+    """
+    if TimezoneFinder is None:
+        return ''
+    return _timezone_finder().timezone_at(lat=float(latitude), lng=float(longitude)) or ''
+
+
+def _hour_angle(latitude, declination, zenith):
+    """
+    Hour angle in degrees at which the sun reaches zenith.
+
+    Returns 180 if the sun stays above that angle all day and 0 if it never
+    gets there (polar day and night).
+    """
+    lat = math.radians(latitude)
+    cos_angle = (
+        math.cos(math.radians(zenith)) / (math.cos(lat) * math.cos(declination))
+        - math.tan(lat) * math.tan(declination)
+    )
+    return math.degrees(math.acos(max(-1.0, min(1.0, cos_angle))))
+
+
+@lru_cache(maxsize=4096)
+def _solar_day(latitude, longitude, day):
+    """
+    Return (solar noon in minutes after UTC midnight, civil hour angle, sunrise hour angle)
+    """
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1)
+    equation_of_time = 229.18 * (
+        0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+        - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma)
+    )
+    declination = (
+        0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+        - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+        - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma)
+    )
+    noon = 720 - 4 * longitude - equation_of_time
+    return (
+        noon,
+        _hour_angle(latitude, declination, CIVIL_ZENITH),
+        _hour_angle(latitude, declination, SUNRISE_ZENITH),
+    )
+
+
+def _utc_day(day, tz):
+    # Local calendar days start at a different UTC instant, so anchor on local noon
+    return datetime.combine(day, time(12), tzinfo=tz).astimezone(dt_timezone.utc).date()
+
+
+def _event(utc_day, minutes, angle, tz):
+    if angle in (0.0, 180.0):
+        return None
+    moment = datetime.combine(utc_day, time(), tzinfo=dt_timezone.utc) + timedelta(minutes=minutes)
+    return moment.astimezone(tz).replace(microsecond=0)
+
+
+def sun_times(latitude, longitude, start, days=1, tz=None):
+    """
+    Return sun events for each of days local dates from start.
+
+    Each entry has date, civil_dawn, sunrise, sunset and civil_dusk as
+    aware datetimes in tz (None where the sun does not cross that angle,
+    e.g. midsummer in northern Norway).
+    """
+    tz = tz or dt_timezone.utc
+    latitude, longitude = round(float(latitude), 4), round(float(longitude), 4)
+    results = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        utc_day = _utc_day(day, tz)
+        noon, civil, sunrise = _solar_day(latitude, longitude, utc_day)
+        results.append({
+            'date': day,
+            'civil_dawn': _event(utc_day, noon - 4 * civil, civil, tz),
+            'sunrise': _event(utc_day, noon - 4 * sunrise, sunrise, tz),
+            'sunset': _event(utc_day, noon + 4 * sunrise, sunrise, tz),
+            'civil_dusk': _event(utc_day, noon + 4 * civil, civil, tz),
+        })
+    return results
+
+
+def _within(minutes_from_noon, angle):
+    if angle == 180.0:
+        return True
+    return abs(minutes_from_noon) < 4 * angle
+
+
+def daylight_flags(latitude, longitude, moments, tz=None):
+    """
+    Return [{'daylight': bool, 'civil_twilight': bool}, ...] for aware datetimes.
+
+    daylight is sunrise to sunset; civil_twilight widens that to civil dawn
+    and dusk.
+    """
+    tz = tz or dt_timezone.utc
+    latitude, longitude = round(float(latitude), 4), round(float(longitude), 4)
+    flags = []
+    for moment in moments:
+        utc_day = _utc_day(moment.astimezone(tz).date(), tz)
+        noon, civil, sunrise = _solar_day(latitude, longitude, utc_day)
+        midnight = datetime.combine(utc_day, time(), tzinfo=dt_timezone.utc)
+        minutes_from_noon = (moment - midnight).total_seconds() / 60 - noon
+        flags.append({
+            'daylight': _within(minutes_from_noon, sunrise),
+            'civil_twilight': _within(minutes_from_noon, civil),
+        })
+    return flags
+
+
+def format_clock(moment):
+    return moment.strftime('%H:%M') if moment else None
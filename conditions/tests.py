@@ -1,3 +1,964 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time as clock
+from array import array
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import deadlines, grid, solar, views, warmstart
+from .admin import WeatherConditionAdmin
+from .archive import archive_path, export_table, import_table, open_archive
+from .backtest import combine_summaries, run_backtest
+from .caches import geocode_cache, weather_cache
+from .deadlines import Deadline, DeadlineExceeded, admission, get_executor
+from .models import (
+    ConditionRollup, Forecast, LatestCondition, Location, RowabilityScore, ScoringProfile, WaterCondition, Watch,
+    Watchlist, WeatherCondition,
+)
+from .queries import history_page, latest_rows, location_rows, recent, seek, upcoming_forecasts
+from .rollups import DAY, HOUR, apply_retention, bucket_start, condition_history, history_tier, rebuild_rollups
+from .scoring import CompiledRules, RuleError, profiles
+from .snapshots import SnapshotMiss, get_store, upstream_get
+from .solar import daylight_flags, sun_times
+from .viewport import viewport
+from .watchlists import _upcoming_forecasts, evaluate_watchlists
+
+
+# Recent enough that raw rows and hourly rollups are both within retention
+START = (timezone.now() - timedelta(days=3)).replace(minute=0, second=0, microsecond=0)
+
+
+class HistoryTestCase(TestCase):
+    """Two locations with twelve hours of every kind of condition row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+        other = Location.objects.create(name='Putney', latitude=51.47, longitude=-0.22)
+        for location in (cls.location, other):
+            for hour in range(12):
+                timestamp = START + timedelta(hours=hour)
+                WeatherCondition.objects.create(
+                    location=location, timestamp=timestamp, temperature=15, wind_speed=hour,
+                    wind_direction=180, humidity=60, pressure=1010,
+                    weather_description='Clear', icon_code='01d',
+                )
+                WaterCondition.objects.create(location=location, timestamp=timestamp, tide_type='high')
+                RowabilityScore.objects.create(
+                    location=location, timestamp=timestamp, score='good', score_value=7, factors={},
+                )
+                Forecast.objects.create(
+                    location=location, forecast_date=START.date() + timedelta(days=hour // 4),
+                    forecast_time=time(hour % 4 * 3), wind_speed=hour, wind_direction=180,
+                    precipitation_probability=10, weather_description='Clear', icon_code='01d',
+                )
+
+
+class HistoryQueryPlanTests(HistoryTestCase):
+    """History queries must be answered from the (location, time) unique indexes, never a full table scan"""
+
+    def assertIndexed(self, queryset):
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            # Tiny test tables are cheaper to scan, so only allow it when no index applies
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+            return
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertNotRegex(plan, rf'\bSCAN {table}\b', plan)
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, plan)
+
+    def test_recent_rows_use_location_index(self):
+        for model in (WeatherCondition, WaterCondition, RowabilityScore, Forecast):
+            with self.subTest(model=model.__name__):
+                self.assertIndexed(recent(model, self.location, 10))
+
+    def test_history_window_uses_location_index(self):
+        end = START + timedelta(hours=6)
+        for model in (WeatherCondition, WaterCondition, RowabilityScore):
+            with self.subTest(model=model.__name__):
+                queryset = location_rows(model, self.location, START, end).order_by('timestamp')
+                self.assertIndexed(queryset)
+        self.assertIndexed(upcoming_forecasts(self.location, START.date(), 10))
+
+    def test_seek_uses_location_index(self):
+        queryset = location_rows(WeatherCondition, self.location, START).order_by('timestamp')
+        self.assertIndexed(seek(queryset, [START + timedelta(hours=3)]))
+        queryset = location_rows(Forecast, self.location).order_by('forecast_date', 'forecast_time')
+        self.assertIndexed(seek(queryset, [START.date(), time(6)]))
+
+    def test_latest_rows_use_location_index(self):
+        self.assertIndexed(latest_rows(WeatherCondition, [self.location.id]))
+        self.assertIndexed(latest_rows(RowabilityScore, [self.location.id]))
+
+    def test_rollup_history_uses_index(self):
+        tier, queryset = condition_history(self.location, START, START + timedelta(days=20))
+        self.assertEqual(tier, ConditionRollup.PERIOD_HOUR)
+        self.assertIndexed(queryset.order_by('period_start'))
+
+
+class KeysetPaginationTests(HistoryTestCase):
+    """Paging with cursors returns every row once, in order"""
+
+    def pages(self, queryset, limit):
+        rows, cursor = history_page(queryset, limit=limit)
+        pages = [rows]
+        while cursor:
+            rows, cursor = history_page(queryset, cursor, limit=limit)
+            pages.append(rows)
+        return pages
+
+    def test_timestamp_pages(self):
+        pages = self.pages(location_rows(WeatherCondition, self.location), 5)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        timestamps = [row.timestamp for page in pages for row in page]
+        self.assertEqual(timestamps, [START + timedelta(hours=hour) for hour in range(12)])
+
+    def test_multi_column_pages(self):
+        pages = self.pages(location_rows(Forecast, self.location).values('forecast_date', 'forecast_time'), 3)
+        slots = [(row['forecast_date'], row['forecast_time']) for page in pages for row in page]
+        self.assertEqual(len(slots), 12)
+        self.assertEqual(slots, sorted(set(slots)))
+        self.assertEqual(slots[0], (START.date(), time(0)))
+
+    def test_history_endpoint_cursor(self):
+        url = f'/api/location/{self.location.id}/history/'
+        params = {'start': START.isoformat(), 'end': (START + timedelta(days=1)).isoformat(), 'limit': 8}
+        first = self.client.get(url, params).json()
+        self.assertEqual(len(first['results']), 8)
+        second = self.client.get(url, {**params, 'cursor': first['next_cursor']}).json()
+        self.assertEqual(len(second['results']), 4)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(self.client.get(url, {**params, 'cursor': 'nonsense'}).status_code, 400)
+
+
+class RollupRebuildTests(TestCase):
+    """Rebuilding rollups must never discard buckets whose raw rows were pruned"""
+
+    def setUp(self):
+        self.location = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+
+    def weather(self, timestamp, wind_speed=4):
+        return WeatherCondition.objects.create(
+            location=self.location, timestamp=timestamp, temperature=15, wind_speed=wind_speed,
+            wind_direction=180, humidity=60, pressure=1010, weather_description='Clear', icon_code='01d',
+        )
+
+    def test_rebuild_keeps_rollups_older_than_raw_retention(self):
+        now = timezone.now()
+        old = now - timedelta(days=60)
+        self.weather(old)
+        self.weather(now - timedelta(hours=2), wind_speed=6)
+        # Retention has since pruned the old raw row, leaving only its rollups
+        WeatherCondition.objects.filter(timestamp__lt=now - timedelta(days=30)).delete()
+
+        rebuild_rollups(now - timedelta(days=60), now=now)
+
+        for period in (HOUR, DAY):
+            rollup = ConditionRollup.objects.get(period=period, period_start=bucket_start(old, period))
+            self.assertEqual(rollup.sample_count, 1)
+        recent_hour = ConditionRollup.objects.get(
+            period=HOUR, period_start=bucket_start(now - timedelta(hours=2), HOUR)
+        )
+        self.assertEqual(recent_hour.wind_speed_max, 6)
+
+
+class RetentionTests(TestCase):
+    """Old raw rows and hourly rollups are pruned, and history reads the finest tier still kept"""
+
+    def test_apply_retention(self):
+        location = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+        now = timezone.now()
+        for age in (timedelta(days=400), timedelta(days=40), timedelta(hours=1)):
+            WeatherCondition.objects.create(
+                location=location, timestamp=now - age, temperature=15, wind_speed=4,
+                wind_direction=180, humidity=60, pressure=1010, weather_description='Clear', icon_code='01d',
+            )
+
+        deleted = apply_retention(now)
+        self.assertEqual((deleted['weather_conditions'], deleted['hour_rollups']), (2, 1))
+        self.assertNotIn('day_rollups', deleted)
+        self.assertEqual(WeatherCondition.objects.count(), 1)
+        self.assertEqual(ConditionRollup.objects.filter(period=HOUR).count(), 2)
+        self.assertEqual(ConditionRollup.objects.filter(period=DAY).count(), 3)
+
+    def test_history_tier(self):
+        now = timezone.now()
+        cases = [
+            (now - timedelta(days=1), now, 'raw'),
+            (now - timedelta(days=10), now, HOUR),
+            (now - timedelta(days=40), now - timedelta(days=38), HOUR),  # raw rows already pruned
+            (now - timedelta(days=90), now, DAY),
+            (now - timedelta(days=400), now - timedelta(days=399), DAY),  # hourly rollups pruned
+        ]
+        for start, end, tier in cases:
+            with self.subTest(days=(now - start).days):
+                self.assertEqual(history_tier(start, end, now), tier)
+
+
+class RollupIncrementTests(TestCase):
+    """Stored rows are folded into their hourly and daily rollups as they arrive"""
+
+    def setUp(self):
+        self.location = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+
+    def score(self, timestamp, score_value):
+        return RowabilityScore.objects.create(
+            location=self.location, timestamp=timestamp, score='good', score_value=score_value, factors={},
+        )
+
+    def test_weather_increments(self):
+        start = bucket_start(START, DAY) + timedelta(hours=10)
+        for minutes, wind_speed, wind_gust in ((0, 4, None), (20, 2, 5), (40, 6, 9), (70, 3, None)):
+            WeatherCondition.objects.create(
+                location=self.location, timestamp=start + timedelta(minutes=minutes), temperature=15,
+                wind_speed=wind_speed, wind_gust=wind_gust, wind_direction=180, humidity=60,
+                pressure=1010, weather_description='Clear', icon_code='01d',
+            )
+
+        hour = ConditionRollup.objects.get(period=HOUR, period_start=start)
+        self.assertEqual(hour.sample_count, 3)
+        self.assertEqual((hour.wind_speed_min, hour.wind_speed_max, hour.wind_gust_max), (2, 6, 9))
+        self.assertEqual(hour.wind_speed_mean, 4)
+        day = ConditionRollup.objects.get(period=DAY, period_start=bucket_start(start, DAY))
+        self.assertEqual((day.sample_count, day.wind_speed_sum, day.wind_speed_min), (4, 15, 2))
+
+    def test_rowable_hours_count_hours_not_scores(self):
+        start = bucket_start(START, DAY) + timedelta(hours=10)
+        self.score(start, 8)
+        day = ConditionRollup.objects.get(period=DAY, period_start=bucket_start(start, DAY))
+        self.assertEqual(day.hours_rowable, 1)
+
+        # A second hour with mostly poor scores is not rowable
+        for minute, value in ((0, 2), (20, 2), (40, 8)):
+            self.score(start + timedelta(hours=1, minutes=minute), value)
+        # The first hour stays rowable on a tie
+        self.score(start + timedelta(minutes=30), 2)
+
+        day.refresh_from_db()
+        self.assertEqual((day.score_count, day.rowable_count, day.hours_rowable), (5, 2, 1))
+        hours = ConditionRollup.objects.filter(period=HOUR).order_by('period_start')
+        self.assertEqual([hour.rowable_hours for hour in hours], [1, 0])
+
+        rebuild_rollups(start - timedelta(hours=1))
+        day = ConditionRollup.objects.get(period=DAY, period_start=bucket_start(start, DAY))
+        self.assertEqual(day.hours_rowable, 1)
+
+
+class ScoringRuleTests(TestCase):
+    """Rule sets are rejected up front rather than failing while scoring"""
+
+    def test_invalid_rules(self):
+        invalid = [
+            {'wind_penalties': [0, 1, 1.5, 4]},
+            {'gust_penalty': '1'},
+            {'darkness_penalty': True},
+            {'wind_limits': [3, '6', 10]},
+            {'visibility_limit': None},
+            {'temperature_ideal': 15},
+            {'temperature_tolerable': [5, 20, 30]},
+            {'wind_limits': [6, 3, 10]},
+            {'headwind_penalty': 1},
+            ['wind_limits'],
+        ]
+        for rules in invalid:
+            with self.subTest(rules=rules), self.assertRaises(RuleError):
+                CompiledRules(rules)
+
+    def test_whole_float_penalties_are_accepted(self):
+        rules = CompiledRules({'wind_penalties': [0, 1.0, 2, 4.0], 'gust_ratio': 2})
+        self.assertEqual(rules.wind_penalties, [0, 1, 2, 4])
+        self.assertEqual(rules.category(rules.score(5)), 'excellent')
+
+    def test_decimal_observations(self):
+        # Model fields hand back Decimals, which do not multiply with the float gust ratio
+        rules = CompiledRules()
+        self.assertEqual(
+            rules.score(Decimal('5.0'), Decimal('12.0'), Decimal('15.0'), Decimal('0.0')),
+            rules.score(5.0, 12.0, 15.0, 0.0),
+        )
+        self.assertLess(rules.score(Decimal('5.0'), Decimal('12.0')), rules.score(Decimal('5.0'), Decimal('6.0')))
+
+    def test_profile_model_validation(self):
+        profile = ScoringProfile(slug='quad', name='Quad', rules={'gust_penalty': 0.5})
+        with self.assertRaises(ValidationError):
+            profile.full_clean()
+
+
+@override_settings(SCORING_PROFILES={'sculling': {'wind_penalties': [0, 3, 5, 8]}})
+class ScoringProfileTests(TestCase):
+    """The profile field resolves slugs from settings and the ScoringProfile table"""
+
+    def setUp(self):
+        profiles.invalidate()
+        self.addCleanup(profiles.invalidate)
+
+    def score(self, **data):
+        return self.client.post('/api/score/', {'wind_speed': 5, 'temperature': 15, 'daylight': True, **data}, content_type='application/json')
+
+    def test_profiles_resolve(self):
+        ScoringProfile.objects.create(slug='eight', name='Eight', rules={'wind_penalties': [0, 0, 1, 2]})
+        self.assertEqual(profiles.slugs(), ['default', 'eight', 'sculling'])
+        scores = {slug: self.score(profile=slug).json()['score'] for slug in ('default', 'sculling', 'eight')}
+        self.assertEqual(scores, {'default': 9, 'sculling': 7, 'eight': 10})
+        self.assertEqual(self.score().json()['score'], 9)
+
+    def test_database_profile_overrides_settings(self):
+        ScoringProfile.objects.create(slug='sculling', name='Sculling', rules={})
+        self.assertEqual(self.score(profile='sculling').json()['score'], 9)
+
+    def test_unknown_profile(self):
+        response = self.score(profile='canoe')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('profile', response.json())
+
+    def test_invalid_stored_profile_is_skipped(self):
+        # Saved without full_clean(), as a raw update or fixture would
+        ScoringProfile.objects.create(slug='broken', name='Broken', rules={'gust_penalty': 'lots'})
+        self.assertNotIn('broken', profiles.slugs())
+        self.assertEqual(self.score(profile='broken').status_code, 400)
+
+
+class WarmStartTests(TestCase):
+    """Cache snapshots round-trip through the file, dropping entries past their TTL"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'warm_start.json')
+        settings = override_settings(WARM_START_PATH=self.path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for cache in (weather_cache, geocode_cache):
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def test_restore_drops_expired_entries(self):
+        now = clock.time()
+        with open(self.path, 'w') as handle:
+            json.dump({
+                'version': warmstart.SNAPSHOT_VERSION,
+                'saved_at': now,
+                'caches': {
+                    'weather': [[[51.5, -0.9], now - 60, {'wind_speed': 4}], [[51.6, -0.9], now - 700, {'wind_speed': 9}]],
+                    'geocode': [[[51.5, -0.9], now - 700, 'Henley']],
+                },
+            }, handle)
+
+        restored = warmstart.load_snapshot()
+        self.assertEqual(restored, {'weather': 1, 'geocode': 1})
+        self.assertEqual(weather_cache.get((51.5, -0.9)), {'wind_speed': 4})
+        self.assertIsNone(weather_cache.get((51.6, -0.9)))
+        self.assertEqual(geocode_cache.get((51.5, -0.9)), 'Henley')
+
+    def test_save_then_load(self):
+        weather_cache.set((51.5, -0.9), {'wind_speed': 4})
+        warmstart.save_snapshot()
+        weather_cache.clear()
+        self.assertEqual(warmstart.load_snapshot()['weather'], 1)
+        self.assertEqual(weather_cache.get((51.5, -0.9)), {'wind_speed': 4})
+
+    def test_not_started_outside_serving_processes(self):
+        self.client.get('/api/profiles/')
+        self.assertIsNone(warmstart._started_pid)
+        self.assertFalse(any(thread.name.startswith('warm-start') for thread in threading.enumerate()))
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ArchiveTests(TestCase):
+    """Archives round-trip rows and keep history the database no longer holds"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.location = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+        for hour in range(6):
+            WeatherCondition.objects.create(
+                location=self.location, timestamp=START + timedelta(hours=hour), temperature=15.5,
+                wind_speed=hour, wind_gust=None if hour % 2 else hour + 2.5, wind_direction=180,
+                humidity=60, pressure=1010, weather_description='Rain' if hour > 3 else 'Clear', icon_code='01d',
+            )
+
+    def rows(self):
+        return list(WeatherCondition.objects.order_by('timestamp').values_list(
+            'timestamp', 'temperature', 'wind_speed', 'wind_gust', 'weather_description',
+        ))
+
+    def test_round_trip(self):
+        original = self.rows()
+        self.assertEqual(export_table('weather', self.location.id, root=self.root), 6)
+        WeatherCondition.objects.all().delete()
+
+        with open_archive('weather', self.location.id, root=self.root) as archive:
+            self.assertEqual(len(archive), 6)
+            self.assertEqual(archive.decode('wind_gust', 0, 2), [2.5, None])
+            import_table(archive)
+        self.assertEqual(self.rows(), original)
+
+    def test_reexport_keeps_pruned_history(self):
+        export_table('weather', self.location.id, root=self.root)
+        WeatherCondition.objects.filter(timestamp__lt=START + timedelta(hours=3)).delete()
+        WeatherCondition.objects.filter(timestamp=START + timedelta(hours=5)).update(wind_speed=9)
+        WeatherCondition.objects.create(
+            location=self.location, timestamp=START + timedelta(hours=6), temperature=15,
+            wind_speed=6, wind_direction=180, humidity=60, pressure=1010,
+            weather_description='Fog', icon_code='50d',
+        )
+
+        self.assertEqual(export_table('weather', self.location.id, root=self.root), 4)
+        # Only the newest rows, as with --days
+        self.assertEqual(export_table('weather', self.location.id, root=self.root,
+                                      since=START + timedelta(hours=5)), 2)
+
+        with open_archive('weather', self.location.id, root=self.root) as archive:
+            self.assertEqual(archive.decode('timestamp'), [START + timedelta(hours=hour) for hour in range(7)])
+            self.assertEqual(archive.decode('wind_speed'), [0, 1, 2, 3, 4, 9, 6])
+            self.assertEqual(archive.decode('weather_description'), ['Clear'] * 4 + ['Rain'] * 2 + ['Fog'])
+
+    def test_reexport_swaps_archive_in_place(self):
+        export_table('weather', self.location.id, root=self.root)
+        path = archive_path('weather', self.location.id, root=self.root)
+        with open_archive('weather', self.location.id, root=self.root) as reader:
+            reader.column('wind_speed')
+            WeatherCondition.objects.filter(timestamp=START).update(wind_speed=9)
+            export_table('weather', self.location.id, root=self.root)
+            # A reader with the column mapped keeps the data it started with
+            self.assertEqual(reader.decode('wind_speed', 0, 1), [0])
+        with open_archive('weather', self.location.id, root=self.root) as archive:
+            self.assertEqual(archive.decode('wind_speed', 0, 1), [9])
+        self.assertEqual(sorted(child.name for child in path.parent.iterdir()), [path.name])
+
+        # An export interrupted between the two renames is recovered by the next one
+        os.replace(path, path.with_name(path.name + '.old'))
+        export_table('weather', self.location.id, root=self.root, since=START + timedelta(hours=5))
+        with open_archive('weather', self.location.id, root=self.root) as archive:
+            self.assertEqual(len(archive), 6)
+
+    def test_import_command_rebuilds_derived_tables(self):
+        export_table('weather', self.location.id, root=self.root)
+        WeatherCondition.objects.all().delete()
+        ConditionRollup.objects.all().delete()
+        LatestCondition.objects.all().delete()
+
+        call_command('import_archive', input=self.root, tables=['weather'], stdout=open(os.devnull, 'w'))
+        self.assertEqual(ConditionRollup.objects.filter(period=HOUR).count(), 6)
+        self.assertEqual(LatestCondition.objects.get(location=self.location).observed_at, START + timedelta(hours=5))
+
+
+class SolarTests(TestCase):
+    """Sun times match published tables to within a couple of minutes"""
+
+    def assertClose(self, moment, expected):
+        self.assertLessEqual(abs(moment - expected), timedelta(minutes=2), moment)
+
+    def test_london_solstices(self):
+        london = ZoneInfo('Europe/London')
+        summer, winter = (sun_times(51.5074, -0.1278, day, 1, london)[0] for day in (date(2024, 6, 21), date(2024, 12, 21)))
+        self.assertClose(summer['sunrise'], datetime(2024, 6, 21, 4, 43, tzinfo=london))
+        self.assertClose(summer['sunset'], datetime(2024, 6, 21, 21, 21, tzinfo=london))
+        self.assertClose(winter['sunrise'], datetime(2024, 12, 21, 8, 4, tzinfo=london))
+        self.assertClose(winter['sunset'], datetime(2024, 12, 21, 15, 53, tzinfo=london))
+
+    def test_polar_day_and_night(self):
+        oslo = ZoneInfo('Europe/Oslo')
+        summer = sun_times(69.65, 18.96, date(2024, 6, 21), 1, oslo)[0]
+        self.assertIsNone(summer['sunrise'])
+        self.assertIsNone(summer['civil_dusk'])
+        winter = sun_times(69.65, 18.96, date(2024, 12, 21), 1, oslo)[0]
+        self.assertIsNone(winter['sunrise'])
+        self.assertIsNotNone(winter['civil_dawn'])
+
+        flags = daylight_flags(69.65, 18.96, [
+            datetime(2024, 6, 21, 0, 30, tzinfo=oslo), datetime(2024, 12, 21, 12, tzinfo=oslo),
+        ], oslo)
+        self.assertEqual(flags, [
+            {'daylight': True, 'civil_twilight': True},
+            {'daylight': False, 'civil_twilight': True},
+        ])
+
+
+class LocationTimezoneTests(TestCase):
+    """Locations get a timezone from their coordinates and forecasts are read in it"""
+
+    def test_filled_on_create(self):
+        finder = mock.Mock(**{'return_value.timezone_at.return_value': 'Australia/Sydney'})
+        solar._timezone_finder.cache_clear()
+        self.addCleanup(solar._timezone_finder.cache_clear)
+        with mock.patch.object(solar, 'TimezoneFinder', finder):
+            sydney = Location.objects.create(name='Sydney', latitude=-33.86, longitude=151.21)
+            named = Location.objects.create(name='Putney', latitude=51.47, longitude=-0.22, timezone='Europe/London')
+        self.assertEqual(sydney.timezone, 'Australia/Sydney')
+        self.assertEqual(named.timezone, 'Europe/London')
+
+    def test_left_blank_without_timezonefinder(self):
+        with mock.patch.object(solar, 'TimezoneFinder', None):
+            location = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+        self.assertEqual(location.timezone, '')
+        self.assertEqual(solar.location_timezone(location), ZoneInfo('Europe/London'))
+
+    def test_watchlist_forecasts_use_local_time(self):
+        location = Location.objects.create(name='Brisbane', latitude=-27.47, longitude=153.03, timezone='Etc/GMT-10')
+        for day, hour in ((1, 21), (2, 21)):
+            Forecast.objects.create(
+                location=location, forecast_date=date(2024, 6, day), forecast_time=time(hour),
+                wind_speed=3, wind_direction=180, precipitation_probability=0,
+                weather_description='Clear', icon_code='01d',
+            )
+        now = datetime(2024, 6, 1, 12, tzinfo=dt_timezone.utc)
+        # 21:00 on 1 June in UTC+10 has passed; 21:00 on 2 June is 11:00 UTC, inside the outlook
+        slots = _upcoming_forecasts({location.id: location}, now)[location.id]
+        self.assertEqual([slot['forecast_date'] for slot in slots], [date(2024, 6, 2)])
+
+    def test_location_detail_forecasts_start_on_local_date(self):
+        location = Location.objects.create(name='Kiritimati', latitude=1.87, longitude=-157.36, timezone='Etc/GMT-14')
+        for day in (1, 2):
+            Forecast.objects.create(
+                location=location, forecast_date=date(2024, 6, day), forecast_time=time(9),
+                wind_speed=3, wind_direction=180, precipitation_probability=0,
+                weather_description='Clear', icon_code='01d',
+            )
+        # Noon UTC on 1 June is already 2 June in UTC+14
+        with mock.patch('django.utils.timezone.now', return_value=datetime(2024, 6, 1, 12, tzinfo=dt_timezone.utc)):
+            response = self.client.get(f'/api/location/{location.id}/')
+        self.assertEqual([forecast['forecast_date'] for forecast in response.json()['forecasts']], ['2024-06-02'])
+
+
+@override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+class ConditionAdminTests(HistoryTestCase):
+    """Admin lists page through filtered rows without exact counts and export as a stream"""
+
+    url = '/admin/conditions/weathercondition/'
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        patcher = mock.patch.object(WeatherConditionAdmin, 'list_per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def changelist(self, page):
+        response = self.client.get(self.url, {'q': 'Henley', 'p': page})
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_filtered_count_is_a_lower_bound(self):
+        first = self.changelist(1)
+        self.assertEqual(str(first.result_count), '5+')
+        self.assertEqual(first.paginator.num_pages, 3)
+
+        # Paging on always reaches further, up to the real last page
+        self.assertEqual(str(self.changelist(3).result_count), '9+')
+        last = self.changelist(6)
+        self.assertEqual(last.result_count, 12)
+        self.assertEqual(len(last.result_list), 2)
+
+    def test_streaming_export(self):
+        ids = list(WeatherCondition.objects.filter(location=self.location).values_list('pk', flat=True))
+        data = {'action': 'export_csv', '_selected_action': ids}
+        response = self.client.post(self.url, data)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'location_id', 'location__name'])
+        self.assertEqual(len(lines), 13)
+
+        response = self.client.post(self.url, {**data, 'action': 'export_ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({row['location__name'] for row in rows}, {'Henley'})
+        self.assertEqual(sorted(float(row['wind_speed']) for row in rows), list(range(12)))
+
+
+class BacktestTests(TestCase):
+    """Archived weather is rescored with both rule sets and summarised per location"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.paths = []
+        for name in ('Henley', 'Putney'):
+            location = Location.objects.create(name=name, latitude=51.5 + len(self.paths), longitude=-0.9)
+            # The six-hour gap before the last reading counts as MAX_OBSERVATION_HOURS
+            for hour, wind_speed in ((0, 2), (1, 5), (2, 8), (3, 12), (4, 2), (10, 5)):
+                WeatherCondition.objects.create(
+                    location=location, timestamp=START + timedelta(hours=hour), temperature=15,
+                    wind_speed=wind_speed, wind_direction=180, humidity=60, pressure=1010,
+                    weather_description='Clear', icon_code='01d',
+                )
+            export_table('weather', location.id, root=self.root)
+            self.paths.append(archive_path('weather', location.id, root=self.root))
+
+    def test_summaries(self):
+        candidate = CompiledRules({'wind_penalties': [0, 3, 5, 8]})
+        summaries = list(run_backtest(self.paths, candidate, workers=1, chunk_size=4))
+        self.assertEqual(len(summaries), 2)
+        summary = summaries[0]
+        self.assertEqual(summary['observations'], 6)
+        self.assertEqual(summary['baseline'], {'dangerous': 0, 'poor': 0, 'fair': 0, 'good': 1, 'excellent': 5})
+        self.assertEqual(summary['candidate'], {'dangerous': 0, 'poor': 1, 'fair': 1, 'good': 2, 'excellent': 2})
+        self.assertEqual(summary['changed'], 4)
+        self.assertEqual((summary['baseline_rowable_hours'], summary['candidate_rowable_hours']), (8.0, 6.0))
+        self.assertEqual(summary['rowable_hours_delta'], -2.0)
+
+        total = combine_summaries(summaries)
+        self.assertEqual((total['observations'], total['changed'], total['rowable_hours_delta']), (12, 8, -4.0))
+        self.assertEqual(total['candidate']['poor'], 2)
+
+    def test_darkness_from_site_coordinates(self):
+        henley = Location.objects.get(name='Henley')
+        sites = {henley.id: (51.5, -0.9, 'Europe/London')}
+        night = lambda latitude, longitude, moments, tz: [{'daylight': False, 'civil_twilight': False}] * len(moments)
+        with mock.patch('conditions.backtest.daylight_flags', side_effect=night):
+            henley, putney = run_backtest(self.paths, CompiledRules(), workers=1, chunk_size=4, sites=sites)
+        # Every score drops by darkness_penalty, which pushes the 12 m/s reading below rowable
+        self.assertEqual(henley['baseline'], {'dangerous': 0, 'poor': 0, 'fair': 1, 'good': 3, 'excellent': 2})
+        self.assertEqual(henley['baseline_rowable_hours'], 7.0)
+        # Putney has no coordinates, so it is scored as daylight
+        self.assertEqual(putney['baseline']['excellent'], 5)
+
+
+# Test rows are all created within seconds, so an overlap window would rescan every location
+@override_settings(WATCHLIST_RESCAN_OVERLAP_SECONDS=0)
+class WatchlistTests(TestCase):
+    """Watches notify when their location crosses a threshold, rescoring only changed locations"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'notifications.jsonl')
+        sinks = override_settings(WATCHLIST_NOTIFICATION_SINKS=[
+            {'BACKEND': 'conditions.notifications.FileSink', 'OPTIONS': {'path': self.path}},
+        ])
+        sinks.enable()
+        self.addCleanup(sinks.disable)
+
+        watchlist = Watchlist.objects.create(name='Club')
+        self.henley = Location.objects.create(name='Henley', latitude=51.54, longitude=-0.9)
+        self.putney = Location.objects.create(name='Putney', latitude=51.47, longitude=-0.22)
+        for location in (self.henley, self.putney):
+            Watch.objects.create(watchlist=watchlist, location=location, notify_at_or_below='poor')
+            self.weather(location, wind_speed=12, temperature=35)  # fair
+
+        # Verdicts should not depend on the time of day the tests run
+        self.daylight = True
+        patcher = mock.patch('conditions.watchlists.daylight_flags', side_effect=lambda latitude, longitude, moments, tz: [
+            {'daylight': self.daylight, 'civil_twilight': self.daylight} for moment in moments
+        ])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def weather(self, location, wind_speed, temperature=15, precipitation=0):
+        return WeatherCondition.objects.create(
+            location=location, timestamp=timezone.now(), temperature=temperature, wind_speed=wind_speed,
+            precipitation=precipitation, wind_direction=180, humidity=60, pressure=1010, weather_description='Clear', icon_code='01d',
+        )
+
+    def notifications(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_crossings(self):
+        self.assertEqual(evaluate_watchlists(timezone.now()), [])
+        self.assertEqual(set(Watch.objects.values_list('last_category', flat=True)), {'fair'})
+
+        self.weather(self.henley, wind_speed=2)
+        # Edited in place, so Putney has no new rows and is not rescored
+        WeatherCondition.objects.filter(location=self.putney).update(wind_speed=20)
+        sent = evaluate_watchlists(timezone.now())
+        self.assertEqual([(note['location_name'], note['change'], note['category']) for note in sent],
+                         [('Henley', 'rowable', 'excellent')])
+        self.assertEqual(Watch.objects.get(location=self.putney).last_category, 'fair')
+
+        self.weather(self.henley, wind_speed=20, temperature=2, precipitation=10)  # poor
+        sent = evaluate_watchlists(timezone.now())
+        self.assertEqual([(note['change'], note['previous'], note['category']) for note in sent],
+                         [('dangerous', 'excellent', 'poor')])
+
+        self.assertEqual([note['change'] for note in self.notifications()], ['rowable', 'dangerous'])
+        self.assertEqual(evaluate_watchlists(timezone.now()), [])
+
+    def test_late_committed_rows_are_rescanned(self):
+        evaluate_watchlists(timezone.now())
+        # Stamped before the last run started but committed after it, as a slow writer would
+        row = self.weather(self.henley, wind_speed=2)
+        WeatherCondition.objects.filter(pk=row.pk).update(created_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(evaluate_watchlists(timezone.now()), [])
+
+        with override_settings(WATCHLIST_RESCAN_OVERLAP_SECONDS=300):
+            sent = evaluate_watchlists(timezone.now())
+            self.assertEqual([(note['location_name'], note['change']) for note in sent], [('Henley', 'rowable')])
+            # Rescanning the same rows again sends nothing new
+            self.assertEqual(evaluate_watchlists(timezone.now()), [])
+
+    def test_darkness_lowers_current_verdict(self):
+        evaluate_watchlists(timezone.now())
+        self.daylight = False
+        self.weather(self.henley, wind_speed=12, temperature=35)
+        sent = evaluate_watchlists(timezone.now())
+        self.assertEqual([(note['location_name'], note['change'], note['category']) for note in sent],
+                         [('Henley', 'dangerous', 'poor')])
+
+
+class WeatherGridTests(TestCase):
+    """Grid points are bilinearly interpolated from their cell's nodes, skipping nodes that failed"""
+
+    region = {'bounds': [51.0, -1.0, 52.0, 0.0], 'step': 1.0}
+    # Node temperatures in lattice order: south-west, south-east, north-west, north-east
+    temperatures = [10, 20, 30, 40]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(WEATHER_GRID_DIR=directory.name, WEATHER_GRID_REGIONS={'thames': self.region})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        grid._grids.clear()
+        self.addCleanup(grid._grids.clear)
+        self.slot = int((timezone.now() + timedelta(hours=3)).timestamp())
+
+    def fetch_node(self, session, lat, lng):
+        index = grid.Lattice(*self.region['bounds'], self.region['step']).point
+        nodes = [index(node) for node in range(4)]
+        node = nodes.index((lat, lng))
+        if node in self.failed:
+            return None, None
+        temperature = self.temperatures[node]
+        wind = {'speed': temperature / 10, 'deg': 270}
+        current = {
+            'main': {'temp': temperature, 'humidity': 60, 'pressure': 1010},
+            'wind': wind, 'weather': [{'description': f'node {node}', 'icon': '01d'}],
+        }
+        forecast = {'list': [{
+            'dt': self.slot, 'main': {'temp_min': temperature - 1, 'temp_max': temperature + 1},
+            'wind': wind, 'pop': 0.5, 'weather': [{'description': f'node {node}', 'icon': '01d'}],
+        }]}
+        return current, forecast
+
+    def refresh(self, failed=()):
+        self.failed = set(failed)
+        with mock.patch.object(grid, '_fetch_node', self.fetch_node):
+            return grid.refresh_grid('thames', self.region, workers=1)
+
+    def test_lattice_weights(self):
+        lattice = grid.Lattice(*self.region['bounds'], self.region['step'])
+        self.assertEqual(lattice.corners(51.25, -0.5), [(0, 0.375), (1, 0.375), (2, 0.125), (3, 0.125)])
+        values = array('f', self.temperatures)
+        self.assertEqual(grid._interpolate(values, lattice.corners(51.25, -0.5)), 20.0)
+        self.assertEqual(grid._interpolate(values, lattice.corners(52.0, 0.0)), 40.0)
+
+    def test_interpolated_conditions(self):
+        self.assertEqual(self.refresh(), (4, 4))
+        current = grid.interpolate_current(51.25, -0.5)
+        self.assertEqual((current['temperature'], current['wind_speed'], current['wind_direction']), (20.0, 2.0, 270))
+        slots = grid.interpolate_forecast(51.25, -0.5, 1)
+        self.assertEqual(len(slots), 1)
+        self.assertEqual((slots[0]['temperature_max'], slots[0]['precipitation_probability']), (21.0, 50))
+        self.assertIsNone(grid.interpolate_current(53.0, -0.5))
+
+    def test_failed_nodes_are_skipped(self):
+        self.assertEqual(self.refresh(failed=[3]), (3, 4))
+        current = grid.interpolate_current(51.25, -0.5)
+        # (10 * 0.375 + 20 * 0.375 + 30 * 0.125) / 0.875
+        self.assertEqual(current['temperature'], 17.1)
+        self.assertEqual(current['weather_description'], 'node 0')
+        # Text comes from the heaviest node with data
+        self.assertEqual(grid.interpolate_current(51.9, -0.3)['weather_description'], 'node 2')
+
+        self.refresh(failed=[0, 1, 2, 3])
+        self.assertIsNone(grid.interpolate_current(51.25, -0.5))
+
+
+@override_settings(CONDITIONS_MAX_IN_FLIGHT=1, CONDITIONS_ADMISSION_WAIT_SECONDS=0, CONDITIONS_REQUEST_BUDGET_SECONDS=0.2)
+class ConditionsDeadlineTests(TestCase):
+    """The conditions endpoint sheds load past capacity and reports sections that ran out of time"""
+
+    def setUp(self):
+        admission._slots = None
+        self.addCleanup(setattr, admission, '_slots', None)
+        # A pool sized for CONDITIONS_MAX_IN_FLIGHT=1, i.e. two upstream threads
+        deadlines._executor = None
+        self.addCleanup(setattr, deadlines, '_executor', None)
+        for name in ('reverse_geocode', 'interpolate_forecast'):
+            patcher = mock.patch.object(views, name, return_value=None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def conditions(self):
+        data = {'latitude': '51.540000', 'longitude': '-0.900000', 'include_forecast': False}
+        return self.client.post('/api/conditions/', data, content_type='application/json')
+
+    def test_sheds_load_past_capacity(self):
+        self.assertTrue(admission.acquire())
+        try:
+            response = self.conditions()
+        finally:
+            admission.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        with mock.patch.object(views, 'fetch_weather_data', return_value=None):
+            self.assertEqual(self.conditions().status_code, 200)
+
+    def test_slow_upstream_times_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow_weather(*args):
+            release.wait(5)
+
+        with mock.patch.object(views, 'fetch_weather_data', slow_weather):
+            started = clock.monotonic()
+            response = self.conditions()
+        self.assertLess(clock.monotonic() - started, 2)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['status']['weather'], 'timeout')
+        # Placeholder conditions are still scored
+        self.assertEqual(body['current_conditions']['wind_speed'], 5.0)
+        self.assertIsNotNone(body['rowability_score'])
+
+    def test_sheds_load_while_upstream_threads_are_busy(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        with mock.patch.object(views, 'fetch_weather_data', lambda *args: release.wait(5)):
+            # Each timed-out request leaves its weather call holding a thread
+            for _ in range(2):
+                self.assertEqual(self.conditions().json()['status']['weather'], 'timeout')
+            response = self.conditions()
+            self.assertEqual(response.status_code, 503)
+
+            release.set()
+            for _ in range(100):
+                if not get_executor().saturated():
+                    break
+                clock.sleep(0.01)
+        with mock.patch.object(views, 'fetch_weather_data', return_value=None):
+            self.assertEqual(self.conditions().status_code, 200)
+
+    def test_upstream_body_is_read_within_the_deadline(self):
+        class TricklingBody:
+            def read(self, amount=None, **kwargs):
+                clock.sleep(0.05)
+                return b' '
+
+            def close(self):
+                pass
+
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = TricklingBody()
+        with mock.patch('requests.get', return_value=response) as get:
+            started = clock.monotonic()
+            with self.assertRaises(DeadlineExceeded):
+                upstream_get('https://nominatim.openstreetmap.org/reverse', timeout=5, deadline=Deadline(0.2))
+        self.assertLess(clock.monotonic() - started, 1)
+        self.assertTrue(get.call_args.kwargs['stream'])
+
+
+class UpstreamSnapshotTests(TestCase):
+    """Recorded upstream responses are replayed without the network, keyed without API keys"""
+
+    url = 'https://api.openweathermap.org/data/2.5/weather'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshots.sqlite3')
+
+    def response(self, body, status=200):
+        response = requests.Response()
+        response.status_code = status
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(body).encode()
+        return response
+
+    def test_record_then_replay(self):
+        params = {'lat': 51.54, 'lon': -0.9, 'appid': 'secret'}
+        with override_settings(UPSTREAM_SNAPSHOT_MODE='record', UPSTREAM_SNAPSHOT_PATH=self.path):
+            with mock.patch('requests.get', return_value=self.response({'wind': {'speed': 4}})):
+                self.assertEqual(upstream_get(self.url, params=params).json(), {'wind': {'speed': 4}})
+            self.assertEqual(get_store().stats()['count'], 1)
+
+        with override_settings(UPSTREAM_SNAPSHOT_MODE='replay', UPSTREAM_SNAPSHOT_PATH=self.path), \
+                mock.patch('requests.get', side_effect=AssertionError('network used in replay')):
+            # Parameter order and the API key do not affect the match
+            replayed = upstream_get(self.url, params={'appid': 'other', 'lon': -0.9, 'lat': 51.54})
+            self.assertEqual(replayed.json(), {'wind': {'speed': 4}})
+            self.assertNotIn('secret', replayed.url)
+
+            with self.assertRaises(SnapshotMiss):
+                upstream_get(self.url, params={'lat': 51.47, 'lon': -0.22})
+
+    def test_failures_are_not_recorded(self):
+        params = {'lat': 51.54, 'lon': -0.9}
+        with override_settings(UPSTREAM_SNAPSHOT_MODE='record', UPSTREAM_SNAPSHOT_PATH=self.path):
+            with mock.patch('requests.get', return_value=self.response({'wind': {'speed': 4}})):
+                upstream_get(self.url, params=params)
+            for status in (429, 503):
+                with mock.patch('requests.get', return_value=self.response({'cod': status}, status)):
+                    self.assertEqual(upstream_get(self.url, params=params).status_code, status)
+                    upstream_get(self.url, params={'lat': 51.47, 'lon': -0.22})
+            self.assertEqual(get_store().stats()['count'], 1)
+            self.assertEqual(get_store().get(self.url, params).json(), {'wind': {'speed': 4}})
+
+
+class ViewportTests(TestCase):
+    """Map viewports select locations by bounding box and cluster them below the max zoom"""
+
+    @classmethod
+    def setUpTestData(cls):
+        places = {
+            'Henley': (51.54, -0.9, 7), 'Marlow': (51.57, -0.77, 3), 'Putney': (51.47, -0.22, None),
+            'Suva': (-18.14, 178.44, None), 'Apia': (-13.83, -171.76, None),
+        }
+        for name, (latitude, longitude, score_value) in places.items():
+            location = Location.objects.create(name=name, latitude=latitude, longitude=longitude)
+            if score_value:
+                RowabilityScore.objects.create(
+                    location=location, timestamp=START, score='good' if score_value > 5 else 'poor',
+                    score_value=score_value, factors={},
+                )
+
+    def names(self, result):
+        return sorted(point['name'] for point in result['locations'])
+
+    def test_bbox(self):
+        self.assertEqual(self.names(viewport(-2, 51, 0, 52, 13)), ['Henley', 'Marlow', 'Putney'])
+        self.assertEqual(self.names(viewport(-0.5, 51, 0, 52, 13)), ['Putney'])
+
+    def test_antimeridian(self):
+        self.assertEqual(self.names(viewport(170, -20, -170, -10, 13)), ['Apia', 'Suva'])
+        # Leaflet reports a wrapped map as longitudes past 180
+        response = self.client.get('/api/locations/', {'bbox': '170,-20,190,-10', 'zoom': 13}).json()
+        self.assertEqual(response['bbox'], [170, -20, -170, -10])
+        self.assertEqual(self.names(response), ['Apia', 'Suva'])
+
+    def test_clustering(self):
+        result = viewport(-2, 51, 0, 52, 6)
+        self.assertEqual(self.names(result), ['Putney'])
+        [cluster] = result['clusters']
+        self.assertEqual((cluster['count'], cluster['scored'], cluster['score_mean']), (2, 2, 5.0))
+        self.assertEqual((cluster['worst'], cluster['categories']), ('poor', {'poor': 1, 'good': 1}))
+        self.assertEqual(cluster['bounds'], [-0.9, 51.54, -0.77, 51.57])
+
+        # At low zoom everything in the box shares a cell
+        [cluster] = viewport(-2, 51, 0, 52, 2)['clusters']
+        self.assertEqual(cluster['count'], 3)
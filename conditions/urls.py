@@ -6,7 +6,10 @@ app_name = 'conditions'
 urlpatterns = [
     path('conditions/', views.get_rowing_conditions, name='get_rowing_conditions'),
     path('score/', views.calculate_rowability_score_api, name='calculate_score'),
+    path('locations/', views.locations_viewport, name='locations_viewport'),
     path('location/<int:location_id>/', views.location_detail, name='location_detail'),
+    path('location/<int:location_id>/history/', views.location_history, name='location_history'),
+    path('profiles/', views.scoring_profiles, name='scoring_profiles'),
     path('health/', views.health_check, name='health_check'),
 ]
 
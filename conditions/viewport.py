@@ -0,0 +1,195 @@
+"""
+Map viewport queries over the denormalized LatestCondition table.
+
+LatestCondition holds one row per location with its newest observation and
+score, kept current on ingest (see signals.py), so a viewport load is one
+range query on the (latitude, longitude) index instead of a latest-row
+subquery per location. Bulk writes bypass the signals and need
+rebuild_latest_conditions afterwards. Points are then grouped on a quadtree of Web
+Mercator tiles: each cluster is a quadkey cell CLUSTER_DEPTH levels below
+the map zoom, roughly CLUSTER_CELL_PIXELS across on screen.
+"""
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import LatestCondition, Location, RowabilityScore, WeatherCondition
+from .queries import recent
+from .scoring import CATEGORIES
+
+
+CLUSTER_DEPTH = 3  # 8x8 cells per 256px tile, about 32px each
+CLUSTER_CELL_PIXELS = 256 >> CLUSTER_DEPTH
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def get_cluster_max_zoom():
+    """Zoom level at and above which every location is returned individually"""
+    return getattr(settings, 'MAP_CLUSTER_MAX_ZOOM', 13)
+
+
+def record_location(location):
+    """
+    Create or refresh a location's LatestCondition row
+    """
+    LatestCondition.objects.update_or_create(
+        location_id=location.pk,
+        defaults={'name': location.name, 'latitude': location.latitude, 'longitude': location.longitude},
+    )
+
+
+def _ensure_row(location_id):
+    if not LatestCondition.objects.filter(location_id=location_id).exists():
+        record_location(Location.objects.get(pk=location_id))
+
+
+def record_weather_condition(condition):
+    """
+    Make condition the location's latest observation unless a newer one is stored
+    """
+    _ensure_row(condition.location_id)
+    LatestCondition.objects.filter(
+        Q(observed_at__isnull=True) | Q(observed_at__lte=condition.timestamp),
+        location_id=condition.location_id,
+    ).update(
+        observed_at=condition.timestamp,
+        wind_speed=condition.wind_speed,
+        wind_gust=condition.wind_gust,
+        temperature=condition.temperature,
+    )
+
+
+def record_rowability_score(score):
+    """
+    Make score the location's latest verdict unless a newer one is stored
+    """
+    _ensure_row(score.location_id)
+    LatestCondition.objects.filter(
+        Q(scored_at__isnull=True) | Q(scored_at__lte=score.timestamp),
+        location_id=score.location_id,
+    ).update(
+        scored_at=score.timestamp,
+        score=score.score,
+        score_value=score.score_value,
+    )
+
+
+def rebuild_latest_conditions(location_ids=None):
+    """
+    Recompute LatestCondition rows from the raw tables; returns the number of locations
+    """
+    locations = Location.objects.all()
+    if location_ids:
+        locations = locations.filter(id__in=location_ids)
+    count = 0
+    for location in locations.iterator():
+        record_location(location)
+        for weather in recent(WeatherCondition, location, 1, ['location', 'timestamp', 'wind_speed', 'wind_gust', 'temperature']):
+            record_weather_condition(weather)
+        for score in recent(RowabilityScore, location, 1, ['location', 'timestamp', 'score', 'score_value']):
+            record_rowability_score(score)
+        count += 1
+    return count
+
+
+def locations_in_bbox(west, south, east, north):
+    """
+    Return LatestCondition values for locations inside a bounding box.
+
+    West greater than east means the box crosses the antimeridian.
+    """
+    queryset = LatestCondition.objects.filter(latitude__gte=south, latitude__lte=north)
+    if west <= east:
+        queryset = queryset.filter(longitude__gte=west, longitude__lte=east)
+    else:
+        queryset = queryset.filter(Q(longitude__gte=west) | Q(longitude__lte=east))
+    return queryset.values(
+        'location_id', 'name', 'latitude', 'longitude', 'observed_at', 'wind_speed',
+        'wind_gust', 'temperature', 'scored_at', 'score', 'score_value',
+    )
+
+
+def tile_position(latitude, longitude, level):
+    """
+    Return fractional Web Mercator tile (x, y) of a point at a zoom level
+    """
+    latitude = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude))
+    scale = 1 << level
+    x = (longitude + 180.0) / 360.0 * scale
+    y = (1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * scale
+    return min(x, scale - 1e-9), min(y, scale - 1e-9)
+
+
+def quadkey(latitude, longitude, level):
+    x, y = tile_position(latitude, longitude, level)
+    x, y = int(x), int(y)
+    digits = []
+    for bit in range(level, 0, -1):
+        mask = 1 << (bit - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def _point(row):
+    return {
+        'id': row['location_id'],
+        'name': row['name'],
+        'latitude': float(row['latitude']),
+        'longitude': float(row['longitude']),
+        'score': row['score'] or None,
+        'score_value': row['score_value'],
+        'scored_at': row['scored_at'],
+        'wind_speed': float(row['wind_speed']) if row['wind_speed'] is not None else None,
+        'observed_at': row['observed_at'],
+    }
+
+
+def _cluster(key, points):
+    scored = [point for point in points if point['score_value'] is not None]
+    categories = Counter(point['score'] for point in scored)
+    return {
+        'quadkey': key,
+        'count': len(points),
+        'latitude': sum(point['latitude'] for point in points) / len(points),
+        'longitude': sum(point['longitude'] for point in points) / len(points),
+        'bounds': [
+            min(point['longitude'] for point in points),
+            min(point['latitude'] for point in points),
+            max(point['longitude'] for point in points),
+            max(point['latitude'] for point in points),
+        ],
+        'scored': len(scored),
+        'score_mean': round(sum(point['score_value'] for point in scored) / len(scored), 1) if scored else None,
+        'score_min': min((point['score_value'] for point in scored), default=None),
+        'score_max': max((point['score_value'] for point in scored), default=None),
+        'worst': min(categories, key=CATEGORIES.index) if categories else None,
+        'categories': {category: categories[category] for category in CATEGORIES if categories[category]},
+    }
+
+
+def viewport(west, south, east, north, zoom):
+    """
+    Return {'clusters': [...], 'locations': [...]} for a map viewport.
+
+    Below get_cluster_max_zoom() nearby locations are merged into clusters
+    with aggregate scores; cells holding a single location, and every
+    location at higher zooms, are returned as individual points.
+    """
+    points = [_point(row) for row in locations_in_bbox(west, south, east, north)]
+    if zoom >= get_cluster_max_zoom():
+        return {'clusters': [], 'locations': points}
+
+    cells = {}
+    for point in points:
+        key = quadkey(point['latitude'], point['longitude'], zoom + CLUSTER_DEPTH)
+        cells.setdefault(key, []).append(point)
+
+    clusters, singles = [], []
+    for key, members in sorted(cells.items()):
+        if len(members) == 1:
+            singles.extend(members)
+        else:
+            clusters.append(_cluster(key, members))
+    return {'clusters': clusters, 'locations': singles}
@@ -5,28 +5,49 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.conf import settings
-from datetime import datetime, timedelta
-import requests
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import date, datetime, time, timedelta
 import json
 
 from .models import Location, WeatherCondition, WaterCondition, RowabilityScore, Forecast
+from .caches import geocode_cache, point_key, weather_cache
+from .deadlines import Deadline, DeadlineExceeded, admission_control, get_executor, get_request_budget
+from .grid import interpolate_current, interpolate_forecast
+from .queries import InvalidCursor, history_page
+from .rollups import condition_history
+from .scoring import DEFAULT_SCORING, profiles
+from .snapshots import upstream_get
+from .solar import daylight_flags, format_clock, get_timezone, location_timezone, sun_times
+from .viewport import viewport
 from .serializers import (
     LocationSerializer, WeatherConditionSerializer, WaterConditionSerializer,
     RowabilityScoreSerializer, ForecastSerializer, LocationDetailSerializer,
-    ConditionsRequestSerializer, RowabilityCalculationSerializer
+    ConditionsRequestSerializer, RowabilityCalculationSerializer,
+    ConditionRollupSerializer, HistoryRequestSerializer, ViewportRequestSerializer
 )
 
 
-def fetch_weather_data(lat, lng):
+def fetch_weather_data(lat, lng, tz=None, deadline=None):
     """
-    Fetch weather data from OpenWeatherMap API
+    Fetch weather data from the weather grid, or the OpenWeatherMap API outside it
     """
     try:
+        # Points inside a fresh weather grid need no upstream call
+        gridded = interpolate_current(lat, lng)
+        if gridded:
+            return format_current_conditions(gridded, lat, lng, tz)
+
         # Check if API key is configured
         if not hasattr(settings, 'OPENWEATHERMAP_API_KEY') or settings.OPENWEATHERMAP_API_KEY == 'your_api_key_here':
             print("Warning: OpenWeatherMap API key not configured, using placeholder data")
             return None
         
+        # Recent lookups for the same point are served from memory
+        cache_key = point_key(lat, lng, 3)
+        cached = weather_cache.get(cache_key)
+        if cached:
+            return format_current_conditions(dict(cached), lat, lng, tz)
+        
         # Fetch current weather
         current_url = f"{settings.OPENWEATHERMAP_BASE_URL}/weather"
         params = {
@@ -37,7 +58,9 @@ def fetch_weather_data(lat, lng):
             'lang': 'en'
         }
         
-        response = requests.get(current_url, params=params, timeout=10)
+        response = upstream_get(
+            current_url, params=params, timeout=deadline.timeout(10) if deadline else 10, deadline=deadline
+        )
         if response.status_code != 200:
             print(f"OpenWeatherMap API error: {response.status_code}")
             return None
@@ -57,37 +80,110 @@ def fetch_weather_data(lat, lng):
             'weather_description': weather_data['weather'][0]['description'],
             'icon_code': weather_data['weather'][0]['icon']
         }
+        weather_cache.set(cache_key, dict(current_conditions))
         
-        # Convert wind direction from degrees to cardinal
-        wind_deg = current_conditions['wind_direction']
-        if wind_deg is not None:
-            directions = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
-                         'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
-            current_conditions['wind_direction'] = directions[round(wind_deg / 22.5) % 16]
-        
-        # Get sunrise/sunset times
-        sunrise_timestamp = weather_data['sys']['sunrise']
-        sunset_timestamp = weather_data['sys']['sunset']
-        
-        # Convert to local time 
-        sunrise_time = datetime.fromtimestamp(sunrise_timestamp).strftime('%H:%M')
-        sunset_time = datetime.fromtimestamp(sunset_timestamp).strftime('%H:%M')
-        
-        current_conditions['sunrise'] = sunrise_time
-        current_conditions['sunset'] = sunset_time
-        
-        return current_conditions
+        return format_current_conditions(current_conditions, lat, lng, tz)
         
     except Exception as e:
         print(f"Error fetching weather data: {e}")
         return None
 
 
+def format_current_conditions(current_conditions, lat, lng, tz=None):
+    """
+    Convert wind direction to a cardinal point and add local sunrise/sunset and daylight
+    """
+    # Convert wind direction from degrees to cardinal
+    wind_deg = current_conditions['wind_direction']
+    if wind_deg is not None:
+        directions = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                     'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+        current_conditions['wind_direction'] = directions[round(wind_deg / 22.5) % 16]
+    
+    # Sun times in the location's timezone
+    tz = tz or get_timezone()
+    now = timezone.now()
+    sun = sun_times(lat, lng, now.astimezone(tz).date(), 1, tz)[0]
+    current_conditions['sunrise'] = format_clock(sun['sunrise'])
+    current_conditions['sunset'] = format_clock(sun['sunset'])
+    current_conditions['daylight'] = daylight_flags(lat, lng, [now], tz)[0]['daylight']
+    
+    return current_conditions
+
+
+def reverse_geocode(lat, lng, deadline=None):
+    """
+    Look up the address around a point with OpenStreetMap Nominatim
+    """
+    cache_key = point_key(lat, lng, 4)
+    cached = geocode_cache.get(cache_key)
+    if cached:
+        return cached
+    
+    response = upstream_get(
+        "https://nominatim.openstreetmap.org/reverse",
+        params={'format': 'json', 'lat': lat, 'lon': lng, 'zoom': 10, 'addressdetails': 1},
+        timeout=deadline.timeout(5) if deadline else 5,
+        deadline=deadline
+    )
+    if response.status_code != 200:
+        print(f"Nominatim API error: {response.status_code}")
+        return None
+    address = response.json().get('address')
+    if address:
+        geocode_cache.set(cache_key, address)
+    return address
+
+
+def apply_address(location, address):
+    """
+    Fill in a location's waterway, nearest town and name from a Nominatim address
+    """
+    # Extract waterway information
+    waterway = address.get('waterway') or address.get('river') or address.get('lake')
+    if waterway:
+        location.waterway_type = waterway
+    
+    # Extract nearest town
+    town = address.get('city') or address.get('town') or address.get('village')
+    if town:
+        location.nearest_town = town
+    
+    # Update location name
+    if waterway and town:
+        location.name = f"{waterway} near {town}"
+    elif waterway:
+        location.name = waterway
+    elif town:
+        location.name = town
+
+
+def wait_for(future, deadline):
+    """
+    Return (result, status) of an upstream call, giving up once the deadline passes
+    """
+    try:
+        return future.result(timeout=deadline.remaining()), 'ok'
+    except (FutureTimeoutError, DeadlineExceeded):
+        # Drop the call if it has not started; a running one stops at its own deadline checks
+        future.cancel()
+        return None, 'timeout'
+    except Exception as e:
+        print(f"Error in upstream call: {e}")
+        return None, 'error'
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@admission_control
 def get_rowing_conditions(request):
     """
     Get rowing conditions for a specific location
+
+    The request runs against a CONDITIONS_REQUEST_BUDGET_SECONDS deadline.
+    Sections that are not ready in time fall back to placeholder data, and
+    'status' reports per section whether data is real ('ok') or a fallback
+    ('fallback', 'timeout', 'error').
     """
     serializer = ConditionsRequestSerializer(data=request.data)
     if not serializer.is_valid():
@@ -96,87 +192,114 @@ def get_rowing_conditions(request):
     data = serializer.validated_data
     lat = data['latitude']
     lng = data['longitude']
+    rules = data['profile']
+    deadline = Deadline(get_request_budget())
+    sections = {}
     
-    # Get or create location
-    location, created = Location.objects.get_or_create(
-        latitude=lat,
-        longitude=lng,
-        defaults={
-            'name': f"Location at {lat}, {lng}",
-            'waterway_type': 'unknown',
-            'nearest_town': 'Unknown'
-        }
-    )
-    
-    # If location was just created, try to get better details
-    if created:
+    with deadline.guard_queries():
+        # Get or create location
         try:
-            # Reverse geocoding using OpenStreetMap Nominatim
-            response = requests.get(
-                f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lng}&zoom=10&addressdetails=1",
-                timeout=5
+            location, created = Location.objects.get_or_create(
+                latitude=lat,
+                longitude=lng,
+                defaults={
+                    'name': f"Location at {lat}, {lng}",
+                    'waterway_type': 'unknown',
+                    'nearest_town': 'Unknown'
+                }
             )
-            if response.status_code == 200:
-                geo_data = response.json()
-                if geo_data.get('address'):
-                    address = geo_data['address']
-                    
-                    # Extract waterway information
-                    waterway = address.get('waterway') or address.get('river') or address.get('lake')
-                    if waterway:
-                        location.waterway_type = waterway
-                    
-                    # Extract nearest town
-                    town = address.get('city') or address.get('town') or address.get('village')
-                    if town:
-                        location.nearest_town = town
-                    
-                    # Update location name
-                    if waterway and town:
-                        location.name = f"{waterway} near {town}"
-                    elif waterway:
-                        location.name = waterway
-                    elif town:
-                        location.name = town
-                    
+        except DeadlineExceeded:
+            return Response({'error': 'Request timed out'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        
+        tz = location_timezone(location)
+        
+        # Start upstream calls in parallel; each one is bounded by the deadline
+        executor = get_executor()
+        geocode_future = executor.submit(reverse_geocode, lat, lng, deadline) if created else None
+        weather_future = executor.submit(fetch_weather_data, lat, lng, tz, deadline) if data['include_weather'] else None
+        
+        forecast_data = []
+        if data['include_forecast']:
+            # Use the weather grid when it covers this point
+            forecast_data = interpolate_forecast(lat, lng, data['days_ahead'], tz) or []
+            sections['forecast'] = 'ok' if forecast_data else 'fallback'
+            
+            # Generate sample forecast data outside the grid
+            if not forecast_data:
+                for i in range(data['days_ahead']):
+                    for time_slot in ['09:00', '12:00', '15:00', '18:00']:
+                        forecast_data.append({
+                            'date': (timezone.now().astimezone(tz).date() + timedelta(days=i)).isoformat(),
+                            'time': time_slot,
+                            'temperature_min': 12.0,
+                            'temperature_max': 18.0,
+                            'wind_speed': 5.0 + (i * 0.5),
+                            'wind_gust': 8.0 + (i * 0.5),
+                            'wind_direction': 180,
+                            'precipitation_probability': 20,
+                            'weather_description': 'Partly cloudy',
+                            'icon_code': '02d'
+                        })
+            slot_times = [
+                datetime.combine(date.fromisoformat(slot['date']), time.fromisoformat(slot['time']), tzinfo=tz)
+                for slot in forecast_data
+            ]
+            for slot, flags in zip(forecast_data, daylight_flags(lat, lng, slot_times, tz)):
+                slot['daylight'] = flags['daylight']
+                slot_score = rules.score(
+                    slot['wind_speed'],
+                    slot['wind_gust'],
+                    (slot['temperature_min'] + slot['temperature_max']) / 2,
+                    daylight=flags['daylight'],
+                )
+                slot['score'] = slot_score
+                slot['category'] = rules.category(slot_score)
+        
+        # If location was just created, try to get better details
+        if geocode_future:
+            address, sections['geocode'] = wait_for(geocode_future, deadline)
+            if address:
+                apply_address(location, address)
+                try:
                     location.save()
-        except Exception as e:
-            print(f"Error in reverse geocoding: {e}")
+                except DeadlineExceeded:
+                    sections['geocode'] = 'timeout'
     
     # Initialize response data
     response_data = {
         'location': LocationSerializer(location).data,
         'current_conditions': {},
-        'forecast': [],
-        'rowability_score': None
+        'forecast': forecast_data,
+        'rowability_score': None,
+        'status': sections
     }
     
-    # Get current weather conditions (placeholder for now)
-    if data['include_weather']:
-        # Try to fetch real weather data from OpenWeatherMap
-        real_weather = fetch_weather_data(lat, lng)
+    # Get current weather conditions
+    if weather_future:
+        real_weather, sections['weather'] = wait_for(weather_future, deadline)
         
         if real_weather:
             response_data['current_conditions'] = real_weather
         else:
+            if sections['weather'] == 'ok':
+                sections['weather'] = 'fallback'
             # Fallback to placeholder data if API call fails
-            response_data['current_conditions'] = {
+            response_data['current_conditions'] = format_current_conditions({
                 'temperature': 15.0,
                 'wind_speed': 5.0,
                 'wind_gust': 8.0,
-                'wind_direction': 'S',
+                'wind_direction': 180,
                 'precipitation': 0.0,
                 'humidity': 65,
                 'pressure': 1013.0,
                 'visibility': 10.0,
                 'weather_description': 'Partly cloudy',
-                'icon_code': '02d',
-                'sunrise': '06:30',
-                'sunset': '18:45'
-            }
+                'icon_code': '02d'
+            }, lat, lng, tz)
     
     # Get water conditions (placeholder for now)
     if data['include_water']:
+        sections['water'] = 'fallback'
         response_data['water_conditions'] = {
             'water_level': None,
             'flow_rate': None,
@@ -187,29 +310,9 @@ def get_rowing_conditions(request):
             'next_tide_time': '14:30'  # Add next tide time
         }
     
-    # Get forecast (placeholder for now)
-    if data['include_forecast']:
-        # Generate sample forecast data
-        forecast_data = []
-        for i in range(data['days_ahead']):
-            for time_slot in ['09:00', '12:00', '15:00', '18:00']:
-                forecast_data.append({
-                    'date': (timezone.now().date() + timedelta(days=i)).isoformat(),
-                    'time': time_slot,
-                    'temperature_min': 12.0,
-                    'temperature_max': 18.0,
-                    'wind_speed': 5.0 + (i * 0.5),
-                    'wind_gust': 8.0 + (i * 0.5),
-                    'wind_direction': 180,
-                    'precipitation_probability': 20,
-                    'weather_description': 'Partly cloudy',
-                    'icon_code': '02d'
-                })
-        response_data['forecast'] = forecast_data
-    
     # Calculate rowability score
     if response_data['current_conditions']:
-        score_data = calculate_rowability_score(response_data['current_conditions'])
+        score_data = calculate_rowability_score(response_data['current_conditions'], rules)
         response_data['rowability_score'] = score_data
     
     return Response(response_data)
@@ -226,12 +329,22 @@ def calculate_rowability_score_api(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     data = serializer.validated_data
-    score_data = calculate_rowability_score(data)
+    rules = data.pop('profile')
+    score_data = calculate_rowability_score(data, rules)
     
     return Response(score_data)
 
 
-def calculate_rowability_score(conditions):
+CATEGORY_RECOMMENDATIONS = {
+    'excellent': 'Excellent conditions for rowing!',
+    'good': 'Good conditions, enjoy your row!',
+    'fair': 'Fair conditions, proceed with caution',
+    'poor': 'Poor conditions, consider alternatives',
+    'dangerous': 'Dangerous conditions, not recommended for rowing',
+}
+
+
+def calculate_rowability_score(conditions, rules=DEFAULT_SCORING):
     """
     Calculate rowability score based on weather and water conditions
     Returns a score from 1-10 with category and recommendations
@@ -242,86 +355,73 @@ def calculate_rowability_score(conditions):
     
     # Wind speed scoring (most important for rowing)
     wind_speed = conditions.get('wind_speed', 0)
-    if wind_speed <= 3:
+    wind_band = rules.wind_band(wind_speed)
+    score -= rules.wind_penalties[wind_band]
+    if wind_band == 0:
         factors.append({'factor': 'wind_speed', 'value': wind_speed, 'impact': 'positive', 'description': 'Light winds ideal for rowing'})
-    elif wind_speed <= 6:
-        score -= 1
+    elif wind_band == 1:
         factors.append({'factor': 'wind_speed', 'value': wind_speed, 'impact': 'minor', 'description': 'Moderate winds, manageable'})
-    elif wind_speed <= 10:
-        score -= 2
+    elif wind_band == 2:
         factors.append({'factor': 'wind_speed', 'value': wind_speed, 'impact': 'moderate', 'description': 'Strong winds, challenging conditions'})
         recommendations.append('Consider shorter sessions or sheltered areas')
     else:
-        score -= 4
         factors.append({'factor': 'wind_speed', 'value': wind_speed, 'impact': 'major', 'description': 'Very strong winds, potentially dangerous'})
         recommendations.append('Not recommended for rowing today')
     
     # Wind gust scoring
     wind_gust = conditions.get('wind_gust')
-    if wind_gust and wind_gust > wind_speed * 1.5:
-        score -= 1
+    if rules.is_gusty(wind_speed, wind_gust):
+        score -= rules.gust_penalty
         factors.append({'factor': 'wind_gust', 'value': wind_gust, 'impact': 'moderate', 'description': 'Gusty conditions, unpredictable'})
         recommendations.append('Be prepared for sudden wind changes')
     
     # Temperature scoring
     temperature = conditions.get('temperature', 20)
-    if 10 <= temperature <= 25:
+    temperature_band = rules.temperature_band(temperature)
+    score -= rules.temperature_penalties[temperature_band]
+    if temperature_band == 0:
         factors.append({'factor': 'temperature', 'value': temperature, 'impact': 'positive', 'description': 'Comfortable temperature for rowing'})
-    elif 5 <= temperature < 10 or 25 < temperature <= 30:
-        score -= 1
+    elif temperature_band == 1:
         factors.append({'factor': 'temperature', 'value': temperature, 'impact': 'minor', 'description': 'Temperature outside ideal range'})
-        if temperature < 10:
+        if temperature < rules.ideal_low:
             recommendations.append('Dress warmly, consider thermal gear')
         else:
             recommendations.append('Stay hydrated, consider early morning sessions')
     else:
-        score -= 2
         factors.append({'factor': 'temperature', 'value': temperature, 'impact': 'moderate', 'description': 'Extreme temperature conditions'})
-        if temperature < 5:
+        if temperature < rules.tolerable_low:
             recommendations.append('Very cold, consider indoor alternatives')
         else:
             recommendations.append('Very hot, consider early morning or evening')
     
     # Precipitation scoring
     precipitation = conditions.get('precipitation', 0)
-    if precipitation > 5:
-        score -= 1
+    if precipitation > rules.precipitation_limit:
+        score -= rules.precipitation_penalty
         factors.append({'factor': 'precipitation', 'value': precipitation, 'impact': 'minor', 'description': 'Wet conditions'})
         recommendations.append('Bring waterproof gear')
     
     # Visibility scoring
     visibility = conditions.get('visibility')
-    if visibility and visibility < 5:
-        score -= 1
+    if visibility and visibility < rules.visibility_limit:
+        score -= rules.visibility_penalty
         factors.append({'factor': 'visibility', 'value': visibility, 'impact': 'moderate', 'description': 'Poor visibility'})
         recommendations.append('Consider postponing or choose well-lit areas')
     
+    # Daylight scoring (only when the caller knows whether it is light)
+    if conditions.get('daylight') is False:
+        score -= rules.darkness_penalty
+        factors.append({'factor': 'daylight', 'value': False, 'impact': 'moderate', 'description': 'Outside daylight hours'})
+        recommendations.append('Use boat lights and stay on familiar water')
+    
     # Ensure score is within 1-10 range
     score = max(1, min(10, score))
     
     # Determine category based on score
-    if score >= 8:
-        category = 'excellent'
-    elif score >= 6:
-        category = 'good'
-    elif score >= 4:
-        category = 'fair'
-    elif score >= 2:
-        category = 'poor'
-    else:
-        category = 'dangerous'
+    category = rules.category(score)
     
-    # Add general recommendations based on score
-    if score >= 8:
-        recommendations.append('Excellent conditions for rowing!')
-    elif score >= 6:
-        recommendations.append('Good conditions, enjoy your row!')
-    elif score >= 4:
-        recommendations.append('Fair conditions, proceed with caution')
-    elif score >= 2:
-        recommendations.append('Poor conditions, consider alternatives')
-    else:
-        recommendations.append('Dangerous conditions, not recommended for rowing')
+    # Add general recommendations based on category
+    recommendations.append(CATEGORY_RECOMMENDATIONS[category])
     
     return {
         'score': score,
@@ -342,6 +442,73 @@ def location_detail(request, location_id):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def location_history(request, location_id):
+    """
+    Get condition history for a location, read from the coarsest tier that fits the window.
+
+    Results are oldest first, limit per page; pass next_cursor back as cursor for the next page.
+    """
+    location = get_object_or_404(Location, id=location_id)
+    serializer = HistoryRequestSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    tier, queryset = condition_history(location, data['start'], data['end'])
+    try:
+        rows, next_cursor = history_page(queryset, data.get('cursor'), data['limit'])
+    except InvalidCursor as e:
+        return Response({'cursor': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+    if tier == 'raw':
+        results = WeatherConditionSerializer(rows, many=True).data
+    else:
+        results = ConditionRollupSerializer(rows, many=True).data
+
+    return Response({
+        'location': location.id,
+        'tier': tier,
+        'start': data['start'].isoformat(),
+        'end': data['end'].isoformat(),
+        'results': results,
+        'next_cursor': next_cursor
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def locations_viewport(request):
+    """
+    Get known locations and their latest verdicts inside a map viewport, clustered below MAP_CLUSTER_MAX_ZOOM
+    """
+    serializer = ViewportRequestSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    west, south, east, north = data['bbox']
+    result = viewport(west, south, east, north, data['zoom'])
+    return Response({
+        'zoom': data['zoom'],
+        'bbox': [west, south, east, north],
+        'clusters': result['clusters'],
+        'locations': result['locations']
+    })
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def scoring_profiles(request):
+    """
+    List the scoring profiles accepted by the conditions and score endpoints
+    """
+    return Response([
+        {'slug': slug, 'rules': profiles.get(slug).rules}
+        for slug in profiles.slugs()
+    ])
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def health_check(request):
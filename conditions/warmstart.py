@@ -0,0 +1,161 @@
+"""
+Warm-start snapshots of in-process caches.
+
+Serving workers periodically (every WARM_START_SNAPSHOT_SECONDS) and at
+exit write their hot state to WARM_START_PATH: the upstream lookup caches
+in caches.py and the compiled scoring profiles. A new worker loads the file
+in a background thread, so requests are not blocked, and also opens the
+weather grids. Each entry is checked for staleness on load: cache entries
+past their TTL are dropped, and restored profiles are re-checked against
+the database on the normal reload schedule.
+
+Only serving processes take part: wsgi.py and asgi.py call start(), and
+the threads begin with each process's first request. Management commands,
+tests and worker pools forked for other work never read or write the file.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+
+from .caches import registered_caches
+from .scoring import profiles
+
+
+SNAPSHOT_VERSION = 1
+
+_loaded = False
+_started_pid = None
+_load_lock = threading.Lock()
+_save_lock = threading.Lock()
+_start_lock = threading.Lock()
+
+
+def get_snapshot_path():
+    return getattr(settings, 'WARM_START_PATH', settings.BASE_DIR / 'warm_start.json')
+
+
+def _read(path):
+    try:
+        with open(path) as handle:
+            snapshot = json.load(handle)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading warm-start snapshot {path}: {e}")
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def load_snapshot(path=None):
+    """
+    Restore caches from the snapshot file; returns {cache name: entries restored}
+    """
+    from .grid import get_regions, load_grid
+
+    restored = {}
+    snapshot = _read(path or get_snapshot_path())
+    if snapshot:
+        caches = registered_caches()
+        for name, entries in snapshot.get('caches', {}).items():
+            if name in caches:
+                restored[name] = caches[name].restore(entries)
+        if snapshot.get('profiles'):
+            age = time.time() - snapshot['saved_at']
+            restored['profiles'] = int(profiles.prime(snapshot['profiles'], age))
+
+    # Grids are read from their own files rather than the snapshot, so load them now
+    for region in get_regions():
+        load_grid(region)
+    return restored
+
+
+def ensure_loaded():
+    """
+    Load the snapshot once per process
+    """
+    global _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if not _loaded:
+            load_snapshot()
+            _loaded = True
+
+
+def save_snapshot(path=None):
+    """
+    Write this process's caches to the snapshot file, merged with entries other workers saved
+    """
+    path = path or get_snapshot_path()
+    # Load first so a process that never read the snapshot does not overwrite it with less
+    ensure_loaded()
+    with _save_lock:
+        previous = _read(path) or {}
+        caches = {}
+        for name, cache in registered_caches().items():
+            cache.restore(previous.get('caches', {}).get(name, []))
+            caches[name] = cache.dump()
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': time.time(),
+            'caches': caches,
+            'profiles': profiles.export() or previous.get('profiles'),
+        }
+
+        staging = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(staging, 'w') as handle:
+                json.dump(snapshot, handle)
+            os.replace(staging, path)
+        except OSError as e:
+            print(f"Error writing warm-start snapshot {path}: {e}")
+
+
+def _save_periodically():
+    interval = getattr(settings, 'WARM_START_SNAPSHOT_SECONDS', 300)
+    while True:
+        time.sleep(interval)
+        save_snapshot()
+
+
+def _save_at_exit():
+    # Forked children inherit atexit handlers, so only the process that started saves
+    if _started_pid == os.getpid():
+        save_snapshot()
+
+
+def _start_in_process(**kwargs):
+    """
+    Start this process's load and save threads on its first request
+    """
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        atexit.register(_save_at_exit)
+        threading.Thread(target=ensure_loaded, name='warm-start-load', daemon=True).start()
+        threading.Thread(target=_save_periodically, name='warm-start-save', daemon=True).start()
+
+
+def start():
+    """
+    Enable warm starts for a serving process; called from wsgi.py and asgi.py.
+
+    Threads do not survive fork, so rather than starting them here each
+    process starts its own when it handles a request. Preforked workers
+    (gunicorn --preload) therefore warm up, while processes that never
+    serve a request start nothing.
+    """
+    if not getattr(settings, 'WARM_START_ENABLED', True):
+        return
+    request_started.connect(_start_in_process, dispatch_uid='conditions.warmstart')
@@ -0,0 +1,222 @@
+"""
+Incremental watchlist evaluation.
+
+Each run only rescores locations whose WeatherCondition or Forecast rows
+were created after the watches on them were last evaluated (less
+WATCHLIST_RESCAN_OVERLAP_SECONDS, for rows committed late), scores each
+(location, profile) pair once however many watches share it, and notifies
+the configured sinks when a watch crosses one of its thresholds. Current
+conditions and forecast slots are flagged as daylight or not at each
+location, as the conditions view does, so both apply the same darkness
+penalty.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import Forecast, Watch, WeatherCondition
+from .notifications import get_sinks
+from .queries import latest_values
+from .scoring import CATEGORIES, profiles
+from .solar import daylight_flags, location_timezone
+
+
+OUTLOOK_HOURS = 24
+
+
+def _rank(category):
+    return CATEGORIES.index(category) if category else None
+
+
+def crossed_threshold(watch, previous, current):
+    """
+    Return 'rowable' or 'dangerous' if current enters a zone previous was outside of
+    """
+    if not current or not previous or previous == current:
+        return None
+    if _rank(current) >= _rank(watch.notify_at_or_above) > _rank(previous):
+        return 'rowable'
+    if _rank(current) <= _rank(watch.notify_at_or_below) < _rank(previous):
+        return 'dangerous'
+    return None
+
+
+def changed_locations(since):
+    """
+    Map location id -> newest created_at of weather/forecast rows created after since
+    """
+    changed = {}
+    for model in (WeatherCondition, Forecast):
+        queryset = model.objects.all()
+        if since is not None:
+            queryset = queryset.filter(created_at__gt=since)
+        rows = queryset.values('location_id').annotate(latest=Max('created_at')).order_by()
+        for row in rows:
+            location_id = row['location_id']
+            changed[location_id] = max(row['latest'], changed.get(location_id, row['latest']))
+    return changed
+
+
+def _latest_weather(location_ids):
+    return latest_values(
+        WeatherCondition, location_ids,
+        ['wind_speed', 'wind_gust', 'temperature', 'precipitation', 'visibility'],
+    )
+
+
+def _upcoming_forecasts(locations, now):
+    """
+    Map location id -> forecast slots in the next OUTLOOK_HOURS.
+
+    Forecast dates and times are local to each location, so the date range
+    is widened by a day either side and slots are compared in local time.
+    """
+    end = now + timedelta(hours=OUTLOOK_HOURS)
+    zones = {location_id: location_timezone(location) for location_id, location in locations.items()}
+    slots = {}
+    rows = Forecast.objects.filter(
+        location_id__in=list(locations),
+        forecast_date__gte=now.date() - timedelta(days=1),
+        forecast_date__lte=end.date() + timedelta(days=1),
+    ).values(
+        'location_id', 'forecast_date', 'forecast_time', 'wind_speed', 'wind_gust',
+        'temperature_min', 'temperature_max',
+    )
+    moments = {}
+    for row in rows:
+        moment = datetime.combine(row['forecast_date'], row['forecast_time'], tzinfo=zones[row['location_id']])
+        if now <= moment <= end:
+            slots.setdefault(row['location_id'], []).append(row)
+            moments.setdefault(row['location_id'], []).append(moment)
+
+    for location_id, location_slots in slots.items():
+        location = locations[location_id]
+        flags = daylight_flags(location.latitude, location.longitude, moments[location_id], zones[location_id])
+        for slot, slot_flags in zip(location_slots, flags):
+            slot['daylight'] = slot_flags['daylight']
+    return slots
+
+
+def _daylight_now(locations, now):
+    """
+    Map location id -> whether now is between sunrise and sunset there
+    """
+    return {
+        location_id: daylight_flags(
+            location.latitude, location.longitude, [now], location_timezone(location)
+        )[0]['daylight']
+        for location_id, location in locations.items()
+    }
+
+
+def _as_float(value, default=None):
+    return float(value) if value is not None else default
+
+
+def score_location(rules, weather, forecast_slots, daylight=True):
+    """
+    Return (current category, worst forecast category) for one location under rules
+    """
+    current = None
+    if weather:
+        current = rules.category(rules.score(
+            float(weather['wind_speed']),
+            _as_float(weather['wind_gust']),
+            float(weather['temperature']),
+            float(weather['precipitation']),
+            _as_float(weather['visibility']),
+            daylight,
+        ))
+
+    outlook = None
+    for slot in forecast_slots or []:
+        low = _as_float(slot['temperature_min'], 20.0)
+        high = _as_float(slot['temperature_max'], low)
+        category = rules.category(rules.score(
+            float(slot['wind_speed']), _as_float(slot['wind_gust']), (low + high) / 2,
+            daylight=slot.get('daylight', True),
+        ))
+        if outlook is None or _rank(category) < _rank(outlook):
+            outlook = category
+    return current, outlook
+
+
+def evaluate_watchlists(now=None, sinks=None):
+    """
+    Re-evaluate watches whose locations have new data and send notifications.
+
+    Watches evaluated for the first time only record their categories, so
+    creating a watch does not fire an alert. Returns the notifications sent.
+    Meant to run periodically (see the evaluate_watchlists command).
+    """
+    now = now or timezone.now()
+    sinks = get_sinks() if sinks is None else sinks
+
+    # Each run stamps every watch with its start time, so the oldest stamp is the previous run.
+    # created_at is set before a row commits, so a row committed after that run started can
+    # carry an earlier stamp; rescanning an overlap window catches it. Rescoring rows already
+    # seen is harmless, since an unchanged category never crosses a threshold.
+    overlap = timedelta(seconds=getattr(settings, 'WATCHLIST_RESCAN_OVERLAP_SECONDS', 300))
+    since = Watch.objects.aggregate(since=Min('last_evaluated_at'))['since']
+    changed = changed_locations(since - overlap) if since is not None else {}
+
+    watches = [
+        watch
+        for watch in Watch.objects.filter(
+            Q(location_id__in=list(changed)) | Q(last_evaluated_at__isnull=True)
+        ).select_related('watchlist', 'location')
+        if watch.last_evaluated_at is None or watch.last_evaluated_at - overlap < changed[watch.location_id]
+    ]
+
+    locations = {watch.location_id: watch.location for watch in watches}
+    weather = _latest_weather(set(locations))
+    forecasts = _upcoming_forecasts(locations, now)
+    daylight = _daylight_now(locations, now)
+
+    verdicts = {}
+    notifications = []
+    for watch in watches:
+        key = (watch.location_id, watch.profile)
+        if key not in verdicts:
+            rules = profiles.get(watch.profile)
+            if rules is None:
+                print(f"Skipping watch {watch.id}: unknown scoring profile {watch.profile}")
+                continue
+            verdicts[key] = score_location(
+                rules, weather.get(watch.location_id), forecasts.get(watch.location_id), daylight[watch.location_id],
+            )
+        current, outlook = verdicts[key]
+
+        for kind, previous, category in (
+            ('current', watch.last_category, current),
+            ('outlook', watch.last_outlook_category, outlook),
+        ):
+            change = crossed_threshold(watch, previous, category)
+            if change:
+                notifications.append((watch.watchlist, {
+                    'watch': watch.id,
+                    'location': watch.location_id,
+                    'location_name': watch.location.name,
+                    'profile': watch.profile,
+                    'kind': kind,
+                    'change': change,
+                    'previous': previous,
+                    'category': category,
+                    'evaluated_at': now.isoformat(),
+                    'message': f"{watch.location.name}: {kind} conditions now {category} ({watch.profile})",
+                }))
+
+        watch.last_category = current or watch.last_category
+        watch.last_outlook_category = outlook or ''
+        watch.last_evaluated_at = now
+
+    Watch.objects.bulk_update(watches, ['last_category', 'last_outlook_category', 'last_evaluated_at'])
+    # Nothing changed for the remaining watches, so their verdicts still hold as of now
+    Watch.objects.filter(last_evaluated_at__lt=now).update(last_evaluated_at=now)
+
+    for watchlist, notification in notifications:
+        for sink in sinks:
+            sink.send(watchlist, notification)
+    return [notification for watchlist, notification in notifications]
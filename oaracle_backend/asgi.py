@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oaracle_backend.settings')
 
 application = get_asgi_application()
+
+# Only serving processes snapshot and warm-start their caches
+from conditions import warmstart  # noqa: E402
+
+warmstart.start()
@@ -116,6 +116,10 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Timezone for locations without one of their own (sun times, forecast dates).
+# New locations look theirs up from their coordinates if timezonefinder is installed.
+CONDITIONS_DEFAULT_TIMEZONE = 'Europe/London'
+
 USE_I18N = True
 
 USE_TZ = True
@@ -151,3 +155,72 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # OpenWeatherMap API Configuration
 OPENWEATHERMAP_API_KEY = os.getenv('OPENWEATHERMAP_API_KEY')  # Replace with your actual API key
 OPENWEATHERMAP_BASE_URL = 'https://api.openweathermap.org/data/2.5'
+
+# Condition history retention in days per tier (None keeps rows forever)
+CONDITIONS_RETENTION_DAYS = {
+    'raw': 30,
+    'hour': 365,
+    'day': None,
+}
+ROWABLE_SCORE_THRESHOLD = 6  # score_value counted as rowable in rollups
+
+# Columnar archives written by the export_archive command
+CONDITIONS_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# Boat-class scoring profiles: overrides of conditions.scoring.DEFAULT_RULES.
+# ScoringProfile rows in the database add to or replace these.
+SCORING_PROFILES = {
+    '1x': {'wind_limits': [2, 4, 7], 'gust_ratio': 1.3},
+    '2x': {'wind_limits': [2.5, 5, 8], 'gust_ratio': 1.4},
+    '4x': {'wind_limits': [3, 6, 10]},
+    '8+': {'wind_limits': [4, 7, 12], 'gust_ratio': 1.6},
+    'coastal': {'wind_limits': [5, 9, 13], 'gust_ratio': 1.8},
+}
+SCORING_PROFILE_RELOAD_SECONDS = 30  # how often workers check the database for profile edits
+
+# Where watchlist notifications go; each sink skips watchlists it has no address for
+WATCHLIST_NOTIFICATION_SINKS = [
+    {'BACKEND': 'conditions.notifications.EmailSink', 'OPTIONS': {'from_email': None}},
+    {'BACKEND': 'conditions.notifications.WebhookSink', 'OPTIONS': {'timeout': 5}},
+]
+# Each watchlist run also rescans rows created this long before the previous run,
+# so rows whose transactions committed after that run started are not missed
+WATCHLIST_RESCAN_OVERLAP_SECONDS = 300
+
+# Weather grid: regions fetched on a lattice by refresh_weather_grid.
+# bounds are [south, west, north, east]; each node costs two API calls per refresh.
+WEATHER_GRID_DIR = BASE_DIR / 'weather_grid'
+WEATHER_GRID_REGIONS = {
+    # 'uk': {'bounds': [49.9, -8.2, 58.7, 1.8], 'step': 0.5},
+}
+WEATHER_GRID_MAX_AGE_MINUTES = 90  # older grids fall back to per-point API calls
+
+# Conditions endpoint: per-request time budget and load shedding
+CONDITIONS_REQUEST_BUDGET_SECONDS = 1.5
+CONDITIONS_MAX_IN_FLIGHT = 32  # concurrent requests before new ones get 503
+CONDITIONS_ADMISSION_WAIT_SECONDS = 0.1  # how long a request may queue for a slot
+
+# Map layer: below this zoom /api/locations/ merges nearby locations into clusters
+MAP_CLUSTER_MAX_ZOOM = 13
+
+# Upstream response snapshots: 'off', 'record' (call upstream and keep responses)
+# or 'replay' (serve recorded responses only, for load tests and upstream outages)
+UPSTREAM_SNAPSHOT_MODE = os.getenv('UPSTREAM_SNAPSHOT_MODE', 'off')
+UPSTREAM_SNAPSHOT_PATH = BASE_DIR / 'snapshots.sqlite3'
+UPSTREAM_SNAPSHOT_RETENTION_DAYS = 30  # default for prune_snapshots
+
+# In-process caches of upstream lookups, snapshotted to WARM_START_PATH by serving
+# processes (started from wsgi.py/asgi.py) so restarted workers start warm
+# (entries older than their TTL are dropped on load)
+WEATHER_CACHE_SECONDS = 600
+GEOCODE_CACHE_SECONDS = 30 * 86400
+WARM_START_ENABLED = True
+WARM_START_PATH = BASE_DIR / 'warm_start.json'
+WARM_START_SNAPSHOT_SECONDS = 300
+
+# Rows of each kind (newest weather, water and scores; upcoming forecasts) in location detail responses
+LOCATION_DETAIL_RECENT_ROWS = 48
+
+# Filtered admin lists count at most this many rows past the current page (shown as 'N+');
+# larger unfiltered tables use the database's estimate
+ADMIN_EXACT_COUNT_LIMIT = 10000
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'oaracle_backend.settings')
 
 application = get_wsgi_application()
+
+# Only serving processes snapshot and warm-start their caches
+from conditions import warmstart  # noqa: E402
+
+warmstart.start()
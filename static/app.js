@@ -3,6 +3,8 @@ class OaracleApp {
         this.map = null;
         this.currentMarker = null;
         this.selectedLocation = null;
+        this.locationsLayer = null;
+        this.viewportRequest = null;
         this.init();
     }
 
@@ -29,6 +31,78 @@ class OaracleApp {
         this.map.on('click', (e) => {
             this.handleMapClick(e);
         });
+
+        // Known locations and their latest verdicts, reloaded as the viewport changes
+        this.locationsLayer = L.layerGroup().addTo(this.map);
+        this.map.on('moveend', () => {
+            this.loadKnownLocations();
+        });
+        this.loadKnownLocations();
+    }
+
+    async loadKnownLocations() {
+        if (this.viewportRequest) {
+            this.viewportRequest.abort();
+        }
+        this.viewportRequest = new AbortController();
+
+        const bbox = this.map.getBounds().toBBoxString();
+        const zoom = this.map.getZoom();
+        try {
+            const response = await fetch(
+                `/api/locations/?bbox=${bbox}&zoom=${zoom}`,
+                { signal: this.viewportRequest.signal }
+            );
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const data = await response.json();
+            this.showKnownLocations(data);
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.error('Error fetching known locations:', error);
+            }
+        }
+    }
+
+    textElement(tag, text) {
+        // Leaflet renders string content as HTML, so untrusted text goes in as a node
+        const element = document.createElement(tag);
+        element.textContent = text;
+        return element;
+    }
+
+    showKnownLocations(data) {
+        this.locationsLayer.clearLayers();
+
+        data.clusters.forEach((cluster) => {
+            const marker = L.marker([cluster.latitude, cluster.longitude], {
+                icon: L.divIcon({
+                    className: `location-cluster score-${cluster.worst || 'unknown'}`,
+                    html: this.textElement('span', cluster.count),
+                    iconSize: [36, 36],
+                    iconAnchor: [18, 18]
+                })
+            });
+            const average = cluster.score_mean !== null ? `average score ${cluster.score_mean}/10` : 'no scores yet';
+            marker.bindTooltip(this.textElement('span', `${cluster.count} locations, ${average}`));
+            marker.on('click', () => {
+                const [west, south, east, north] = cluster.bounds;
+                this.map.fitBounds([[south, west], [north, east]], { padding: [40, 40] });
+            });
+            this.locationsLayer.addLayer(marker);
+        });
+
+        data.locations.forEach((location) => {
+            const marker = L.circleMarker([location.latitude, location.longitude], {
+                radius: 7,
+                weight: 2,
+                className: `location-point score-${location.score || 'unknown'}`
+            });
+            const verdict = location.score ? `${location.score} (${location.score_value}/10)` : 'not scored yet';
+            marker.bindTooltip(this.textElement('span', `${location.name}: ${verdict}`));
+            this.locationsLayer.addLayer(marker);
+        });
     }
 
     bindEvents() {